@@ -0,0 +1,27 @@
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    """Eigener Event-Loop in einem Daemon-Thread, damit synchroner Code (sched) Coroutinen ausführen kann."""
+
+    def __init__(self, name='background-loop'):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout)
+
+    def submit(self, coro):
+        """Startet eine Coroutine im Hintergrund, ohne auf das Ergebnis zu warten."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
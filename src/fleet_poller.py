@@ -0,0 +1,50 @@
+import asyncio
+from collections import namedtuple
+
+# values: {inverter_id: Wert}, missed: Wechselrichter ohne Antwort bis zur Deadline, failed: {inverter_id: Exception}
+PollResult = namedtuple('PollResult', ['values', 'missed', 'failed'])
+
+
+async def poll_fleet(inverters, fetch, concurrency=10, deadline=4.0, prepare=None):
+    """Fragt alle Wechselrichter parallel ab (höchstens `concurrency` gleichzeitig) und bricht nach `deadline` Sekunden ab.
+
+    `prepare` (z. B. die Erreichbarkeitsprüfung) läuft vorher und zählt zur Deadline; dauert es zu lange, wird
+    mit dem bisherigen Stand weiter abgefragt.
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    if prepare is not None:
+        try:
+            await asyncio.wait_for(prepare, deadline)
+        except asyncio.TimeoutError:
+            pass
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def poll_one(inverter):
+        async with semaphore:
+            return await fetch(inverter)
+
+    tasks = {asyncio.ensure_future(poll_one(inverter)): inverter["id"] for inverter in inverters}
+    if not tasks:
+        return PollResult({}, [], {})
+
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, end - loop.time()))
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    values = {}
+    failed = {}
+    for task in done:
+        inverter_id = tasks[task]
+        if task.exception() is not None:
+            failed[inverter_id] = task.exception()
+        else:
+            values[inverter_id] = task.result()
+
+    # Reihenfolge der Konfiguration beibehalten
+    order = [inverter["id"] for inverter in inverters]
+    missed = [inverter_id for inverter_id in order if inverter_id not in values and inverter_id not in failed]
+    values = {inverter_id: values[inverter_id] for inverter_id in order if inverter_id in values}
+    return PollResult(values, missed, failed)
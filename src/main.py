@@ -7,6 +7,7 @@ import variables
 from modbus_utilities import ModbusUtils
 
 scheduler = sched.scheduler(time.time, time.sleep)
+modbus = ModbusUtils(variables.modbus_tcp_ip)
 
 def log_message(message):
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -71,36 +72,17 @@ def retrieve_total_peak_power():
     return total_power
 
 def write_modbus_32bit_register(total_power):
-    modbus = ModbusUtils(variables.modbus_tcp_ip)
-    try:
-        response = modbus.write_32bit_register(0, total_power)
-        log_message(f"Write Response: {response}")
-    finally:
-        modbus.close()
+    response = modbus.write_32bit_register(0, total_power)
+    log_message(f"Write Response: {response}")
 
 def read_coils(address):
-    modbus = ModbusUtils(variables.modbus_tcp_ip)
-    try:
-        response = modbus.read_coils(int(address))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
-        return response
-    finally:
-        modbus.close()
+    return modbus.read_coils(int(address))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
 
 def read_input_modbus_register(register):
-    modbus = ModbusUtils(variables.modbus_tcp_ip)
-    try:
-        response = modbus.read_input_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
-        return response
-    finally:
-        modbus.close()
+    return modbus.read_input_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
 
 def read_holding_modbus_register(register):
-    modbus = ModbusUtils(variables.modbus_tcp_ip)
-    try:
-        response = modbus.read_holding_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
-        return response
-    finally:
-        modbus.close()
+    return modbus.read_holding_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
 
 def do_regulation(regulation_factor, dry_run):
     for inverter_id in variables.inverter_ids:
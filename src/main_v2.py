@@ -1,15 +1,30 @@
 import os
-import json
+import asyncio
+import functools
 import sched
-import struct
 import time
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
 from pymodbus.client.tcp import ModbusTcpClient
 from pymodbus.exceptions import ModbusException
 from widgetlords.pi_spi import *
 
+from async_utilities import BackgroundLoop
+from fleet_poller import poll_fleet
+from modbus_connection import ModbusConnectionManager
+from openems_api_client import OpenEmsClient
+from peak_power_cache import PeakPowerCache
+from reachability import ReachabilityCache
+from register_codec import FLOAT32
+from refu_client import REFU_PORT, RefuClient
+from setpoint_dispatcher import SetpointDispatcher
+
+# Protokollierung, auch von den Hilfsklassen genutzt
+def log_message(message):
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print(f"[{timestamp}] {message}")
+
+
 # Variablen
 inverter_ids = [
     {
@@ -143,11 +158,34 @@ inverter_ids = [
 ]
 
 modbus_tcp_ip = '192.168.0.27'
+modbus_timeout = 3.0  # Sekunden pro Modbus-Anfrage
 min_power = -1200
 max_power = 1200
 max_dac = 3723
 min_dac = 745
 
+poll_concurrency = 10
+poll_deadline = 4.0  # Sekunden, muss kürzer als der 5-Sekunden-Zyklus sein
+openems_component_pattern = 'meter.*'  # Regex für Sammelabfragen, Ergebnis wird auf inverter_ids gefiltert
+reachability_ttl = 30.0  # Sekunden
+peak_power_ttl = 3600.0  # Sekunden, Nennleistung ändert sich nur bei Gerätetausch
+refu_default_peak_power = 20000  # Watt, für Wechselrichter deren Nennleistung noch nicht gelesen wurde
+# Parameter-ID der Nennleistung aus der REFU-Parameterliste; None = refu_default_peak_power für jeden Wechselrichter
+refu_nominal_power_parameter = None
+setpoint_deadband = 0.01  # Änderung des Regelfaktors, ab der neu geschrieben wird
+setpoint_max_age = 300.0  # Sekunden, danach wird der Sollwert auch unverändert erneut geschrieben
+
+# Event-Loop für die Geräte-I/O (REFU-Verbindungen, paralleles Abfragen)
+io_loop = BackgroundLoop('device-io')
+# Eigene Threads für blockierende OpenEMS-Anfragen; abgebrochene Abfragen belegen ihren Thread bis zum HTTP-Timeout,
+# der Standard-Executor (auf dem Pi 8 Threads) wird dadurch nicht blockiert
+openems_executor = ThreadPoolExecutor(max_workers=poll_concurrency, thread_name_prefix='openems')
+refu_client = RefuClient()
+reachability = ReachabilityCache(REFU_PORT, ttl=reachability_ttl)
+refu_peak_power = PeakPowerCache(refu_client, log_message, parameter=refu_nominal_power_parameter, ttl=peak_power_ttl)
+openems = OpenEmsClient(modbus_tcp_ip, pool_size=poll_concurrency)
+setpoint_dispatcher = SetpointDispatcher(setpoint_deadband, max_age=setpoint_max_age)
+
 
 # ModbusUtils Klasse
 class ModbusUtils:
@@ -156,17 +194,15 @@ class ModbusUtils:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ModbusUtils, cls).__new__(cls)
-            cls._instance.client = ModbusTcpClient(modbus_tcp_ip)
+            # Eine dauerhafte Verbindung für alle Zyklen, wird bei Verbindungsfehlern automatisch neu aufgebaut
+            cls._instance.connection = ModbusConnectionManager(
+                ModbusTcpClient, modbus_tcp_ip, timeout=modbus_timeout,
+                probe=lambda client: client.read_coils(12, 1, slave=5))
         return cls._instance
 
-    def __init__(self):
-        # Initialisiere deine Modbus-Verbindung hier, falls noch nicht geschehen
-        if not hasattr(self, 'client'):
-            self.client = ModbusTcpClient(modbus_tcp_ip)
-
     def read_coils(self, address, count=1, slave=5):
         try:
-            response = self.client.read_coils(address, count, slave=slave)
+            response = self.connection.execute(lambda client: client.read_coils(address, count, slave=slave))
             if response.isError():
                 raise ModbusException(f"Error reading coils at address {address}")
             return response.bits
@@ -174,9 +210,29 @@ class ModbusUtils:
             log_message(f"Modbus exception: {e}")
             return None
 
+    def read_input_registers(self, address, count=1, slave=5):
+        try:
+            response = self.connection.execute(lambda client: client.read_input_registers(address, count, slave=slave))
+            if response.isError():
+                raise ModbusException(f"Error reading input registers at address {address}")
+            return response.registers
+        except ModbusException as e:
+            log_message(f"Modbus exception: {e}")
+            return None
+
+    def read_holding_registers(self, address, count=1, slave=5):
+        try:
+            response = self.connection.execute(lambda client: client.read_holding_registers(address, count, slave=slave))
+            if response.isError():
+                raise ModbusException(f"Error reading holding registers at address {address}")
+            return response.registers
+        except ModbusException as e:
+            log_message(f"Modbus exception: {e}")
+            return None
+
     def write_register(self, address, value, slave=5):
         try:
-            response = self.client.write_register(address, value, slave=slave)
+            response = self.connection.execute(lambda client: client.write_register(address, value, slave=slave))
             if response.isError():
                 raise ModbusException(f"Error writing register at address {address}")
             return response
@@ -189,14 +245,13 @@ class ModbusUtils:
             # Konvertiere den Float-Wert zu UInt16-Array
             uint16_array = self.convert_float_to_uint16_array(value)
 
-            # Schreibe die beiden UInt16-Werte in die entsprechenden Register
-            response_high = self.client.write_register(address, uint16_array[0], slave=slave)
-            response_low = self.client.write_register(address + 1, uint16_array[1], slave=slave)
+            # Beide Register in einer FC16-Anfrage schreiben, damit kein Leser einen halb geschriebenen Wert sieht
+            response = self.connection.execute(lambda client: client.write_registers(address, uint16_array, slave=slave))
 
-            if response_high.isError() or response_low.isError():
+            if response.isError():
                 raise ModbusException(f"Error writing 32-bit value at address {address}")
 
-            return (response_high, response_low)
+            return response
 
         except ModbusException as e:
             log_message(f"Modbus exception: {e}")
@@ -204,126 +259,53 @@ class ModbusUtils:
 
     @staticmethod
     def convert_float_to_uint16_array(float_value):
-        # Konvertiere den Float-Wert in eine 4-Byte-Darstellung (Big-Endian)
-        buffer = struct.pack('>f', float_value)
-
-        # Extrahiere die ersten zwei UInt16-Werte aus dem Puffer (Big-Endian)
-        uint16_value1 = struct.unpack('>H', buffer[0:2])[0]
-        uint16_value2 = struct.unpack('>H', buffer[2:4])[0]
-
-        return [uint16_value1, uint16_value2]
+        # Float als zwei UInt16-Werte (Big-Endian, höherwertiges Wort zuerst)
+        return FLOAT32.encode(float_value)
 
     def close(self):
-        self.client.close()
+        self.connection.close()
 
 
-def get_current_power(inverter_id):
-    try:
-        url = f'http://x:admin@{modbus_tcp_ip}:8084/rest/channel/{inverter_id}/ActivePower'
-        response = requests.get(url)
-        response_dict = response.json()
-        return response_dict['value']
-    except Exception as e:
-        log_message(f"Error getting current power: {e}")
-        return None
-
 def is_reachable(ip_address):
-    try:
-        process = subprocess.Popen(['ping', '-c', '1', ip_address], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        if process.returncode == 0:
-            # log_message(f"Erreichbarkeitstest erfolgreich für IP: {ip_address}")
-            return True
-        else:
-            log_message(f"Erreichbarkeitstest fehlgeschlagen: {stderr.decode('utf-8').strip()}")
-    except Exception as e:
-        log_message(f"Fehler beim Erreichbarkeitstest: {str(e)}")
-    return False
+    return reachability.is_reachable(ip_address)
 
 
-def get_current_power_refu(inverter_id):
+async def read_current_power_refu(inverter_id):
     if not is_reachable(inverter_id):
         log_message(f"Inverter {inverter_id} is not reachable.")
         return 0
 
-    try:
-        for _ in range(10): # 10 Retries
-            try:
-                process = subprocess.Popen(f'socat - TCP4:{inverter_id}:21063', shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = process.communicate(input=b'REFU.GetParameter 1106\n')
-                stderr_output = stderr.decode('utf-8').strip()
-                stdout_output = stdout.decode('utf-8').strip()
-                
-                if process.returncode == 0 and not stderr_output and stdout_output:
-                    try:
-                        # Umwandlung in eine Ganzzahl
-                        power_value = int(float(stdout_output))
-                        return power_value
-                    except ValueError:
-                        log_message("Error converting power value to integer.")
-                        return 0
-            except Exception as inner_exception:
-                log_message(f"Attempt failed with error: {inner_exception}")
-    except Exception as e:
-        log_message(f"Error getting current power from refu inverter: {e}")
-        return 0
-    
+    for _ in range(10):  # 10 Retries
+        try:
+            power_value = await refu_client.get_current_power(inverter_id)
+            reachability.mark(inverter_id, True)
+            return power_value
+        except ValueError:
+            log_message("Error converting power value to integer.")
+            return 0
+        except Exception as inner_exception:
+            log_message(f"Attempt failed with error: {inner_exception}")
+
+    reachability.mark(inverter_id, False)
     log_message(f"Failed to get current power from refu inverter after 10 retries.")
     return 0
 
-def set_current_power_refu(inverter_id,regulation_factor):
+
+def set_current_power_refu(inverter_id, regulation_factor):
     if not is_reachable(inverter_id):
         log_message(f"Inverter {inverter_id} is not reachable.")
-        return 0
+        return False
 
-    try:
-        for _ in range(10): # 10 Retries
-            try:
-                process = subprocess.Popen(f'socat - TCP4:{inverter_id}:21063', shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                multiplied_factor = regulation_factor * 1000
-                command = f'REFU.SetParameter 1162,0,{multiplied_factor}\n'
-                stdout, stderr = process.communicate(input=command.encode())
-                stderr_output = stderr.decode('utf-8').strip()
-                stdout_output = stdout.decode('utf-8').strip()
-
-            except Exception as inner_exception:
-                log_message(f"Attempt failed with error: {inner_exception}")
-    except Exception as e:
-        log_message(f"Error setting current power from refu inverter: {e}")
-        return 0
-    
-    log_message(f"Failed to set current power from refu inverter after 10 retries.")
-    return 0
-
-
-def get_peak_power(inverter_id):
-    try:
-        url = f'http://x:admin@{modbus_tcp_ip}:8084/rest/channel/{inverter_id}/MaxApparentPower'
-        response = requests.get(url)
-        response_dict = response.json()
-        return response_dict['value']
-    except Exception as e:
-        log_message(f"Error getting peak power: {e}")
-        return None
-
-
-def write_channel_value(inverter_id, channel, value):
-    try:
-        url = f'http://x:admin@{modbus_tcp_ip}:8084/rest/channel/{inverter_id}/{channel}'
-        headers = {'Content-Type': 'application/json'}
-        payload = json.dumps({'value': value})
-        response = requests.post(url, headers=headers, data=payload, auth=('admin', 'x'))
-
-        if response.status_code == 200:
-            response_dict = response.json()
-            return response_dict['value']
-        else:
-            log_message(f"Error updating channel value: {response.text}")
-            return None
+    for _ in range(10):  # 10 Retries
+        try:
+            if io_loop.run(refu_client.set_power_limit(inverter_id, regulation_factor)):
+                return True
+            log_message(f"Inverter {inverter_id} did not confirm the power limit.")
+        except Exception as inner_exception:
+            log_message(f"Attempt failed with error: {inner_exception}")
 
-    except Exception as e:
-        log_message(f"Error updating channel value: {e}")
-    return None
+    log_message(f"Failed to set current power from refu inverter after 10 retries.")
+    return False
 
 
 # Kommunale Dienstleistungsfunktionen
@@ -347,11 +329,6 @@ def write_output(dac_value):
 
 
 # Hauptfunktionen
-def log_message(message):
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-    print(f"[{timestamp}] {message}")
-
-
 def regulate_direktvermarkter():
     polling_activation_list = read_coils(12)
     if isinstance(polling_activation_list, list) and len(polling_activation_list) > 0:
@@ -392,92 +369,124 @@ def main():
     scheduler.enter(5, 1, main)  # Schedule the next call in 5 seconds
 
 
+def refu_hosts():
+    return [inverter["id"] for inverter in inverter_ids if inverter["type"] == "REFU"]
+
+
+def openems_ids():
+    return [inverter["id"] for inverter in inverter_ids if inverter["type"] == "OPENEMS"]
+
+
+def read_openems_channel_values(channel):
+    # Eine Anfrage für alle Zähler, Komponenten außerhalb der Konfiguration (z. B. Netzzähler) werden verworfen
+    values = openems.get_channel_values(openems_component_pattern, channel, openems_ids()) or {}
+    return {inverter_id: values.get(inverter_id) for inverter_id in openems_ids()}
+
+
+async def poll_active_power():
+    openems_values = asyncio.get_running_loop().run_in_executor(openems_executor, read_openems_channel_values, 'ActivePower')
+    try:
+        # Erreichbarkeit der ganzen Flotte auf einmal prüfen, danach nur noch Cache-Abfragen; beides innerhalb der Deadline
+        return await poll_fleet(inverter_ids, lambda inverter: fetch_active_power(inverter, openems_values),
+                                poll_concurrency, poll_deadline, prepare=reachability.refresh(refu_hosts()))
+    finally:
+        openems_values.cancel()
+
+
+async def fetch_active_power(inverter, openems_values):
+    if inverter["type"] == "OPENEMS":
+        # Gemeinsames Ergebnis der Sammelabfrage; shield, damit ein Abbruch nicht die anderen Zähler trifft
+        values = await asyncio.shield(openems_values)
+        return values[inverter["id"]]
+    return await read_current_power_refu(inverter["id"])
+
+
 def retrieve_active_power():
+    result = io_loop.run(poll_active_power())
     total_power = 0
 
-    for inverter in inverter_ids:
-        if inverter["type"] == "OPENEMS":
-            current_power = get_current_power(inverter["id"])
-            log_message(inverter["id"] + ' active_power: ' + str(current_power))
-            total_power += current_power
-        else:
-            current_power = get_current_power_refu(inverter["id"])
-            log_message(inverter["id"] + ' active_power: ' + str(current_power))
+    for inverter_id, current_power in result.values.items():
+        log_message(inverter_id + ' active_power: ' + str(current_power))
+        if current_power is not None:
             total_power += current_power
 
+    for inverter_id, error in result.failed.items():
+        log_message(f"Polling {inverter_id} failed: {error}")
+    if result.missed:
+        log_message('Inverters missed the polling deadline: ' + str(result.missed))
+
     return total_power / 1000
 
 
 def retrieve_total_peak_power():
     total_power = 0
-    # TODO - Max Total Peak power der Refu Wechselrichter in Watt
-    refu_total_power = 579000
 
-    for inverter in inverter_ids:
-        if inverter["type"] == "OPENEMS":
-            current_power = get_peak_power(inverter["id"])
-            log_message(inverter["id"] + ' peak_power: ' + str(current_power))
+    for inverter_id, current_power in read_openems_channel_values('MaxApparentPower').items():
+        log_message(inverter_id + ' peak_power: ' + str(current_power))
+        if current_power is not None:
             total_power += current_power
 
+    # Nennleistung der aktuell erreichbaren REFU-Wechselrichter aus dem Cache
+    refu_total_power = refu_peak_power.total(reachable_refu_hosts(), refu_default_peak_power)
+    log_message('refu_total_power: ' + str(refu_total_power))
+
     return total_power + refu_total_power
 
 
+def reachable_refu_hosts():
+    return [host for host in refu_hosts() if is_reachable(host)]
+
+
 def write_modbus_32bit_register(total_power):
-    modbus = ModbusUtils()
-    try:
-        response = modbus.write_32bit_register(0, total_power)
-        log_message(f"Write Response: {response}")
-    finally:
-        modbus.close()
+    response = ModbusUtils().write_32bit_register(0, total_power)
+    log_message(f"Write Response: {response}")
 
 
 def read_coils(address):
-    modbus = ModbusUtils()
-    try:
-        response = modbus.read_coils(int(address))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
-        return response
-    finally:
-        modbus.close()
+    return ModbusUtils().read_coils(int(address))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
 
 
 def read_input_modbus_register(register):
-    modbus = ModbusUtils()
-    try:
-        response = modbus.read_input_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
-        return response
-    finally:
-        modbus.close()
+    return ModbusUtils().read_input_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
 
 
 def read_holding_modbus_register(register):
-    modbus = ModbusUtils()
-    try:
-        response = modbus.read_holding_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
-        return response
-    finally:
-        modbus.close()
+    return ModbusUtils().read_holding_registers(int(register))  # Sicherstellen, dass die Adresse eine ganze Zahl ist
+
+
+def write_openems_setpoint(inverter_id, peak_power, regulation_factor):
+    # write_channel_value liefert bei jedem Fehler None
+    return openems.write_channel_value(inverter_id, 'SetActivePower', regulation_factor * peak_power) is not None
 
 
 def do_regulation(regulation_factor, dry_run):
+    peak_powers = read_openems_channel_values('MaxApparentPower')
     for inverter in inverter_ids:
         if inverter["type"] == "OPENEMS":
-            peak_power = get_peak_power(inverter["id"])
+            peak_power = peak_powers[inverter["id"]]
+            if peak_power is None:
+                log_message(f"No peak power for {inverter['id']}, skipping regulation.")
+                continue
             value_to_write = regulation_factor * peak_power
             if dry_run:
                 log_message('Dry RUN: Value would be: ' + str(value_to_write))
             else:
-                write_channel_value(inverter["id"], 'SetActivePower', value_to_write)
+                # Nur schreiben, wenn der Regelfaktor das Totband verlässt oder der letzte Sollwert zu alt ist
+                setpoint_dispatcher.dispatch(inverter["id"], regulation_factor,
+                                             functools.partial(write_openems_setpoint, inverter["id"], peak_power))
         elif inverter["type"] == "REFU":
             if dry_run:
                 log_message('Dry RUN: Would call set_current_power_refu with: ' + str(inverter["id"]) + ', ' + str(regulation_factor))
             else:
-                set_current_power_refu(inverter["id"], regulation_factor)
+                setpoint_dispatcher.dispatch(inverter["id"], regulation_factor,
+                                             functools.partial(set_current_power_refu, inverter["id"]))
 
 
 
 # Hauptausführung
 if __name__ == '__main__':
     outputs = Mod2AO()
+    io_loop.submit(refu_peak_power.run(reachable_refu_hosts))
     scheduler = sched.scheduler(time.time, time.sleep)
     scheduler.enter(0, 1, main)
     scheduler.enter(0, 1, regulate_direktvermarkter)
@@ -1,17 +1,31 @@
 import os
-import json
-import sched
-import struct
+import asyncio
+import functools
 import time
-import subprocess
 
-import requests
-from pymodbus.client import ModbusTcpClient
+import aiohttp
+from pymodbus.client import AsyncModbusTcpClient
 from pymodbus.exceptions import ModbusException
-from pymodbus.payload import BinaryPayloadBuilder
-from pymodbus.constants import Endian
 from widgetlords.pi_spi import *
 
+from fleet_poller import poll_fleet
+from metadata_cache import MetadataCache
+from modbus_connection import AsyncModbusConnectionManager
+from openems_async_client import AsyncOpenEmsClient
+from openems_subscription import OpenEmsSubscription
+from peak_power_cache import PeakPowerCache
+from reachability import ReachabilityCache
+from register_codec import FLOAT32
+from register_map import REGISTER_MAP
+from refu_client import REFU_PORT, REFU_TELEMETRY, RefuClient
+from retry_policy import CircuitBreakerRegistry, CircuitOpenError, RetryPolicy
+from setpoint_dispatcher import SetpointDispatcher
+
+# Protokollierung, auch von den Hilfsklassen genutzt
+def log_message(message):
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print(f"[{timestamp}] {message}")
+
 # Variablen
 inverter_ids = [
     {
@@ -145,11 +159,47 @@ inverter_ids = [
 ]
 
 modbus_tcp_ip = '192.168.0.27'
+modbus_timeout = 3.0  # Sekunden pro Modbus-Anfrage
+telemetry_interval = 5.0  # Sekunden zwischen zwei Leistungsmessungen
+regulation_interval = 3.0  # Sekunden zwischen zwei Abfragen der Direktvermarkter-Vorgabe
 min_power = -1200
 max_power = 1200
 max_dac = 3723
 min_dac = 745
 
+poll_concurrency = 10
+poll_deadline = 4.0  # Sekunden, muss kürzer als der 5-Sekunden-Zyklus sein
+openems_component_pattern = 'meter.*'  # Regex für Sammelabfragen, Ergebnis wird auf inverter_ids gefiltert
+# TTL in Sekunden pro OpenEMS-Kanal; nicht aufgeführte Kanäle (ActivePower) werden jeden Zyklus gelesen
+openems_metadata_ttls = {'MaxApparentPower': 3600.0}
+openems_websocket_port = 8085
+openems_stream_max_age = 5.0  # Sekunden; ältere Stream-Werte gelten als veraltet und werden per REST gelesen
+reachability_ttl = 30.0  # Sekunden
+peak_power_ttl = 3600.0  # Sekunden, Nennleistung ändert sich nur bei Gerätetausch
+refu_default_peak_power = 20000  # Watt, für Wechselrichter deren Nennleistung noch nicht gelesen wurde
+# Parameter-ID der Nennleistung aus der REFU-Parameterliste; None = refu_default_peak_power für jeden Wechselrichter
+refu_nominal_power_parameter = None
+setpoint_deadband = 0.01  # Änderung des Regelfaktors, ab der neu geschrieben wird
+setpoint_max_age = 300.0  # Sekunden, danach wird der Sollwert auch unverändert erneut geschrieben
+breaker_failure_threshold = 5  # Fehlversuche in Folge, bis ein Gerät übersprungen wird
+breaker_reset_timeout = 30.0  # Sekunden bis zum nächsten Probeversuch
+
+refu_client = RefuClient()
+reachability = ReachabilityCache(REFU_PORT, ttl=reachability_ttl)
+refu_peak_power = PeakPowerCache(refu_client, log_message, parameter=refu_nominal_power_parameter, ttl=peak_power_ttl)
+setpoint_dispatcher = SetpointDispatcher(setpoint_deadband, max_age=setpoint_max_age)
+# Gemeinsame Wiederholungsstrategie für alle Geräte-I/O (REFU-TCP und OpenEMS-REST)
+device_retry_policy = RetryPolicy(attempts=3, base_delay=0.2, max_delay=2.0,
+                                  retry_on=(OSError, asyncio.TimeoutError, aiohttp.ClientError))
+device_breakers = CircuitBreakerRegistry(breaker_failure_threshold, breaker_reset_timeout)
+openems_metadata_cache = MetadataCache(openems_metadata_ttls)
+openems = AsyncOpenEmsClient(modbus_tcp_ip, concurrency=poll_concurrency, retry_policy=device_retry_policy,
+                             breakers=device_breakers, cache=openems_metadata_cache)
+# Live-Werte der OpenEMS-Zähler per Websocket, REST nur noch als Rückfallebene
+openems_stream = OpenEmsSubscription(modbus_tcp_ip,
+                                     [inverter["id"] + '/ActivePower' for inverter in inverter_ids if inverter["type"] == "OPENEMS"],
+                                     port=openems_websocket_port)
+
 # ModbusUtils Klasse
 class ModbusUtils:
     _instance = None
@@ -157,141 +207,115 @@ class ModbusUtils:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ModbusUtils, cls).__new__(cls)
-            cls._instance.client = ModbusTcpClient(modbus_tcp_ip)
+            # Eine dauerhafte asynchrone Verbindung, Anfragen laufen im selben Event-Loop wie das Abfragen der Wechselrichter
+            cls._instance.connection = AsyncModbusConnectionManager(
+                AsyncModbusTcpClient, modbus_tcp_ip, timeout=modbus_timeout,
+                probe=lambda client: client.read_coils(12, 1, slave=5))
         return cls._instance
 
-    def __init__(self):
-        if not hasattr(self, 'client'):
-            self.client = ModbusTcpClient(modbus_tcp_ip)
-
-    def read_coils(self, address, count=1, slave=5):
+    async def read_coils(self, address, count=1, slave=5):
         try:
-            response = self.client.read_coils(address, count, slave=slave)
+            response = await self.connection.execute(lambda client: client.read_coils(address, count, slave=slave))
             if response.isError():
                 raise ModbusException(f"Error reading coils at address {address}")
             return response.bits
-        except ModbusException as e:
-            log_message(f"Modbus exception: {e}")
+        except (ModbusException, asyncio.TimeoutError) as e:
+            log_message(f"Modbus exception: {e!r}")
+            return None
+
+    async def read_input_registers(self, address, count=1, slave=5):
+        try:
+            response = await self.connection.execute(lambda client: client.read_input_registers(address, count, slave=slave))
+            if response.isError():
+                raise ModbusException(f"Error reading input registers at address {address}")
+            return response.registers
+        except (ModbusException, asyncio.TimeoutError) as e:
+            log_message(f"Modbus exception: {e!r}")
             return None
 
-    def write_input_register(self, address, value, slave=5):
+    async def read_holding_registers(self, address, count=1, slave=5):
         try:
-            builder = BinaryPayloadBuilder(byteorder=Endian.Big, wordorder=Endian.Big)
-            builder.add_32bit_float(value)
-            payload = builder.build()
-            response = self.client.write_registers(address, payload, skip_encode=True, slave=slave)
+            response = await self.connection.execute(lambda client: client.read_holding_registers(address, count, slave=slave))
+            if response.isError():
+                raise ModbusException(f"Error reading holding registers at address {address}")
+            return response.registers
+        except (ModbusException, asyncio.TimeoutError) as e:
+            log_message(f"Modbus exception: {e!r}")
+            return None
+
+    async def read_points(self, names, slave=5):
+        """Liest die genannten Datenpunkte aus REGISTER_MAP mit möglichst wenigen Anfragen und liefert {name: Wert}."""
+        values = {}
+        try:
+            for block in REGISTER_MAP.plan_reads(names):
+                if block.function_code == 4:
+                    response = await self.connection.execute(lambda client: client.read_input_registers(block.address, block.count, slave=slave))
+                else:
+                    response = await self.connection.execute(lambda client: client.read_holding_registers(block.address, block.count, slave=slave))
+                if response.isError():
+                    raise ModbusException(f"Error reading registers at address {block.address}")
+                values.update(REGISTER_MAP.decode_block(block, response.registers))
+            return values
+        except (ModbusException, asyncio.TimeoutError) as e:
+            log_message(f"Modbus exception: {e!r}")
+            return None
+
+    async def write_input_register(self, address, value, slave=5):
+        try:
+            # Float über den vorkompilierten Codec, beide Register in einer FC16-Anfrage
+            registers = FLOAT32.encode(value)
+            response = await self.connection.execute(lambda client: client.write_registers(address, registers, slave=slave))
             if response.isError():
                 raise ModbusException(f"Error writing input register at address {address}")
             return response
-        except ModbusException as e:
-            log_message(f"Modbus exception: {e}")
+        except (ModbusException, asyncio.TimeoutError) as e:
+            log_message(f"Modbus exception: {e!r}")
             return None
 
     def close(self):
-        self.client.close()
-
-def get_current_power(inverter_id):
-    try:
-        url = f'http://x:admin@{modbus_tcp_ip}:8084/rest/channel/{inverter_id}/ActivePower'
-        response = requests.get(url)
-        response_dict = response.json()
-        return response_dict['value']
-    except Exception as e:
-        log_message(f"Error getting current power: {e}")
-        return None
+        self.connection.close()
 
 def is_reachable(ip_address):
-    try:
-        process = subprocess.Popen(['ping', '-c', '1', ip_address], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        if process.returncode == 0:
-            return True
-        else:
-            log_message(f"Erreichbarkeitstest fehlgeschlagen: {stderr.decode('utf-8').strip()}")
-    except Exception as e:
-        log_message(f"Fehler beim Erreichbarkeitstest: {str(e)}")
-    return False
+    return reachability.is_reachable(ip_address)
 
-def get_current_power_refu(inverter_id):
+async def read_current_power_refu(inverter_id):
     if not is_reachable(inverter_id):
         log_message(f"Inverter {inverter_id} is not reachable.")
         return 0
 
     try:
-        for _ in range(10):  # 10 Retries
-            try:
-                process = subprocess.Popen(f'socat - TCP4:{inverter_id}:21063', shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = process.communicate(input=b'REFU.GetParameter 1106\n')
-                stderr_output = stderr.decode('utf-8').strip()
-                stdout_output = stdout.decode('utf-8').strip()
-                
-                if process.returncode == 0 and not stderr_output and stdout_output:
-                    try:
-                        power_value = int(float(stdout_output))
-                        return power_value
-                    except ValueError:
-                        log_message("Error converting power value to integer.")
-                        return 0
-            except Exception as inner_exception:
-                log_message(f"Attempt failed with error: {inner_exception}")
+        telemetry = await device_retry_policy.call_async(refu_client.read, inverter_id, REFU_TELEMETRY, breaker=device_breakers.get(inverter_id))
+    except CircuitOpenError:
+        log_message(f"Skipping {inverter_id}, circuit breaker is open.")
+        return 0
     except Exception as e:
-        log_message(f"Error getting current power from refu inverter: {e}")
+        reachability.mark(inverter_id, False)
+        log_message(f"Failed to get current power from refu inverter: {e}")
         return 0
-    
-    log_message(f"Failed to get current power from refu inverter after 10 retries.")
-    return 0
 
-def set_current_power_refu(inverter_id, regulation_factor):
-    if not is_reachable(inverter_id):
-        log_message(f"Inverter {inverter_id} is not reachable.")
+    reachability.mark(inverter_id, True)
+    if telemetry.active_power is None:
+        log_message("Error converting power value to integer.")
         return 0
+    return telemetry.active_power
 
-    try:
-        for _ in range(10):  # 10 Retries
-            try:
-                process = subprocess.Popen(f'socat - TCP4:{inverter_id}:21063', shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                multiplied_factor = regulation_factor * 1000
-                command = f'REFU.SetParameter 1162,0,{multiplied_factor}\n'
-                stdout, stderr = process.communicate(input=command.encode())
-                stderr_output = stderr.decode('utf-8').strip()
-                stdout_output = stdout.decode('utf-8').strip()
-
-            except Exception as inner_exception:
-                log_message(f"Attempt failed with error: {inner_exception}")
-    except Exception as e:
-        log_message(f"Error setting current power from refu inverter: {e}")
-        return 0
-    
-    log_message(f"Failed to set current power from refu inverter after 10 retries.")
-    return 0
+async def set_current_power_refu(inverter_id, regulation_factor):
+    if not is_reachable(inverter_id):
+        log_message(f"Inverter {inverter_id} is not reachable.")
+        return False
 
-def get_peak_power(inverter_id):
     try:
-        url = f'http://x:admin@{modbus_tcp_ip}:8084/rest/channel/{inverter_id}/MaxApparentPower'
-        response = requests.get(url)
-        response_dict = response.json()
-        return response_dict['value']
+        confirmed = await device_retry_policy.call_async(refu_client.set_power_limit, inverter_id, regulation_factor, breaker=device_breakers.get(inverter_id))
+    except CircuitOpenError:
+        log_message(f"Skipping {inverter_id}, circuit breaker is open.")
+        return False
     except Exception as e:
-        log_message(f"Error getting peak power: {e}")
-        return None
+        log_message(f"Failed to set current power from refu inverter: {e}")
+        return False
 
-def write_channel_value(inverter_id, channel, value):
-    try:
-        url = f'http://x:admin@{modbus_tcp_ip}:8084/rest/channel/{inverter_id}/{channel}'
-        headers = {'Content-Type': 'application/json'}
-        payload = json.dumps({'value': value})
-        response = requests.post(url, headers=headers, data=payload, auth=('admin', 'x'))
-
-        if response.status_code == 200:
-            response_dict = response.json()
-            return response_dict['value']
-        else:
-            log_message(f"Error updating channel value: {response.text}")
-            return None
-
-    except Exception as e:
-        log_message(f"Error updating channel value: {e}")
-    return None
+    if not confirmed:
+        log_message(f"Inverter {inverter_id} did not confirm the power limit.")
+    return confirmed
 
 # Kommunale Dienstleistungsfunktionen
 def calculate_dac_value(power):
@@ -313,110 +337,190 @@ def write_output(dac_value):
         log_message(f"Error writing output: {e}")
 
 # Hauptfunktionen
-def log_message(message):
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-    print(f"[{timestamp}] {message}")
-
-def regulate_direktvermarkter():
-    modbus = ModbusUtils()
-    try:
-        polling_activation_list = modbus.read_coils(12)
-        if isinstance(polling_activation_list, list) and len(polling_activation_list) > 0:
-            polling_activation = bool(polling_activation_list[0])
-        else:
-            log_message("ERROR: Invalid set point specification value")
-            return
-
-        log_message('Polling activation: ' + str(polling_activation))
-
-        if polling_activation:
-            log_message('Start regulation of inverters: ' + str(inverter_ids))
-            total_peak_power = retrieve_total_peak_power()
-            log_message('total_peak_power: ' + str(total_peak_power))
-            set_point_specification = modbus.client.read_holding_registers(10, 1).registers
-            log_message('Set point specification: ' + str(set_point_specification))
+async def read_modbus_setpoint():
+    # Sollwertvorgabe (HR 10-11, Float) und Abrufaktivierung (HR 12, Bit 0) mit einer Anfrage lesen
+    return await ModbusUtils().read_points(['set_point', 'polling_activation'])
+
+async def regulate_direktvermarkter(setpoint_source=None):
+    # setpoint_source: Coroutine-Funktion, die {'set_point': ..., 'polling_activation': ...} oder None liefert
+    points = await (setpoint_source or read_modbus_setpoint)()
+    if points is None:
+        log_message("ERROR: Invalid set point specification value")
+        return
+
+    polling_activation = points['polling_activation']
+    log_message('Polling activation: ' + str(polling_activation))
+
+    if polling_activation:
+        log_message('Start regulation of inverters: ' + str(inverter_ids))
+        total_peak_power = await retrieve_total_peak_power()
+        log_message('total_peak_power: ' + str(total_peak_power))
+        set_point_value = points['set_point']
+        log_message('Set point specification: ' + str(set_point_value))
+
+        regulate_factor = set_point_value / total_peak_power
+        log_message('Using regulate factor: ' + str(regulate_factor) + ' for every inverter.')
+        await do_regulation(regulate_factor, True)
+
+async def main(power_sink=None):
+    total_power = await retrieve_active_power()
+    log_message('total_power: ' + str(total_power))
 
-            if isinstance(set_point_specification, list) and len(set_point_specification) > 0:
-                set_point_value = set_point_specification[0]
-            else:
-                log_message("ERROR: Invalid set point specification value")
-                return
+    # 4-20 mA Signal senden; SPI-Zugriff blockiert und läuft daher in einem Worker-Thread
+    await asyncio.get_running_loop().run_in_executor(None, write_output, calculate_dac_value(total_power))
 
-            regulate_factor = set_point_value / total_peak_power
-            log_message('Using regulate factor: ' + str(regulate_factor) + ' for every inverter.')
-            do_regulation(regulate_factor, True)
+    # Modbus TCP Input Register schreiben (oder die übergebene Coroutine-Funktion aufrufen)
+    await (power_sink or write_modbus_input_register)(total_power)
 
+async def run_periodically(interval, job, *args, wakeup=None):
+    # Fester Takt ab Startzeitpunkt, ein langsamer Durchlauf verschiebt die folgenden nicht dauerhaft;
+    # ein gesetztes `wakeup` (asyncio.Event) löst den nächsten Durchlauf sofort aus
+    next_run = time.monotonic()
+    while True:
+        try:
+            await job(*args)
+        except Exception as e:
+            log_message(f"{job.__name__} failed: {e!r}")
+        next_run = max(next_run + interval, time.monotonic())
+        if wakeup is None:
+            await asyncio.sleep(next_run - time.monotonic())
+            continue
+        try:
+            await asyncio.wait_for(wakeup.wait(), next_run - time.monotonic())
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        next_run = min(next_run, time.monotonic())
+
+async def run(power_sink=None, setpoint_source=None, regulation_wakeup=None, services=()):
+    """Telemetrie und Regelung; Standard ist der Austausch mit dem Modbus-Server über TCP.
+
+    main_v4 übergibt stattdessen Zugriffe auf den Datenspeicher des Servers und den Server selbst als `services`.
+    """
+    background = [asyncio.ensure_future(refu_peak_power.run(reachable_refu_hosts)),
+                  asyncio.ensure_future(openems_stream.run())]
+    try:
+        # Telemetrie und Direktvermarkter-Regelung laufen unabhängig voneinander im selben Event-Loop
+        await asyncio.gather(*services,
+                             run_periodically(telemetry_interval, main, power_sink),
+                             run_periodically(regulation_interval, regulate_direktvermarkter, setpoint_source,
+                                              wakeup=regulation_wakeup))
     finally:
-        modbus.close()
-
-    scheduler.enter(3, 1, regulate_direktvermarkter)  # Schedule the next call in 3 seconds
-
-def main():
-    total_power = retrieve_active_power()
-    log_message('total_power: ' + str(total_power))
-
-    # 4-20 mA Signal senden
-    write_output(calculate_dac_value(total_power))
+        for task in background:
+            task.cancel()
+        if ModbusUtils._instance is not None:
+            ModbusUtils().close()
+        await refu_client.close()
+        await openems.close()
+
+def refu_hosts():
+    return [inverter["id"] for inverter in inverter_ids if inverter["type"] == "REFU"]
+
+def openems_ids():
+    return [inverter["id"] for inverter in inverter_ids if inverter["type"] == "OPENEMS"]
+
+async def read_openems_channel_values(channel):
+    # Eine Anfrage für alle Zähler, Komponenten außerhalb der Konfiguration (z. B. Netzzähler) werden verworfen
+    values = await openems.get_channel_values(openems_component_pattern, channel, openems_ids()) or {}
+    return {inverter_id: values.get(inverter_id) for inverter_id in openems_ids()}
+
+async def read_openems_active_power():
+    # Solange der Websocket-Stream frische Werte liefert, ist keine Anfrage an das Edge nötig
+    streamed = openems_stream.store.fresh_values(openems_stream.channels, openems_stream_max_age)
+    if streamed is not None:
+        return {address.split('/', 1)[0]: value for address, value in streamed.items()}
+    return await read_openems_channel_values('ActivePower')
+
+async def poll_active_power():
+    openems_values = asyncio.ensure_future(read_openems_active_power())
+    try:
+        # Erreichbarkeit der ganzen Flotte auf einmal prüfen, danach nur noch Cache-Abfragen; beides innerhalb der Deadline
+        return await poll_fleet(inverter_ids, lambda inverter: fetch_active_power(inverter, openems_values),
+                                poll_concurrency, poll_deadline, prepare=reachability.refresh(refu_hosts()))
+    finally:
+        openems_values.cancel()
 
-    # Modbus TCP Input Register schreiben
-    write_modbus_input_register(total_power)
-    scheduler.enter(5, 1, main)  # Schedule the next call in 5 seconds
+async def fetch_active_power(inverter, openems_values):
+    if inverter["type"] == "OPENEMS":
+        # Gemeinsames Ergebnis der Sammelabfrage; shield, damit ein Abbruch nicht die anderen Zähler trifft
+        values = await asyncio.shield(openems_values)
+        return values[inverter["id"]]
+    return await read_current_power_refu(inverter["id"])
 
-def retrieve_active_power():
+async def retrieve_active_power():
+    result = await poll_active_power()
     total_power = 0
 
-    for inverter in inverter_ids:
-        if inverter["type"] == "OPENEMS":
-            current_power = get_current_power(inverter["id"])
-            log_message(inverter["id"] + ' active_power: ' + str(current_power))
-            total_power += current_power
-        else:
-            current_power = get_current_power_refu(inverter["id"])
-            log_message(inverter["id"] + ' active_power: ' + str(current_power))
+    for inverter_id, current_power in result.values.items():
+        log_message(inverter_id + ' active_power: ' + str(current_power))
+        if current_power is not None:
             total_power += current_power
 
+    for inverter_id, error in result.failed.items():
+        log_message(f"Polling {inverter_id} failed: {error}")
+    if result.missed:
+        log_message('Inverters missed the polling deadline: ' + str(result.missed))
+
     return total_power / 1000
 
-def retrieve_total_peak_power():
+def reachable_refu_hosts():
+    return [host for host in refu_hosts() if is_reachable(host)]
+
+async def retrieve_total_peak_power():
     total_power = 0
-    # TODO - Max Total Peak power der Refu Wechselrichter in Watt
-    refu_total_power = 579000
 
-    for inverter in inverter_ids:
-        if inverter["type"] == "OPENEMS":
-            current_power = get_peak_power(inverter["id"])
-            log_message(inverter["id"] + ' peak_power: ' + str(current_power))
+    for inverter_id, current_power in (await read_openems_channel_values('MaxApparentPower')).items():
+        log_message(inverter_id + ' peak_power: ' + str(current_power))
+        if current_power is not None:
             total_power += current_power
 
+    # Nennleistung der aktuell erreichbaren REFU-Wechselrichter aus dem Cache
+    refu_total_power = refu_peak_power.total(reachable_refu_hosts(), refu_default_peak_power)
+    log_message('refu_total_power: ' + str(refu_total_power))
+
     return total_power + refu_total_power
 
-def write_modbus_input_register(total_power):
-    modbus = ModbusUtils()
-    try:
-        response = modbus.write_input_register(0, total_power)
-        log_message(f"Write Response: {response}")
-    finally:
-        modbus.close()
+async def write_modbus_input_register(total_power):
+    response = await ModbusUtils().write_input_register(0, total_power)
+    log_message(f"Write Response: {response}")
+
+async def write_openems_setpoint(inverter_id, peak_power, regulation_factor):
+    # write_channel_value liefert bei jedem Fehler None
+    return await openems.write_channel_value(inverter_id, 'SetActivePower', regulation_factor * peak_power) is not None
 
-def do_regulation(regulation_factor, dry_run):
+async def dispatch_openems_setpoints(regulation_factor, peak_powers):
+    # Alle Zähler parallel; das Totband entscheidet pro Zähler, ob überhaupt geschrieben wird
+    await asyncio.gather(*(setpoint_dispatcher.dispatch_async(inverter_id, regulation_factor,
+                                                              functools.partial(write_openems_setpoint, inverter_id, peak_power))
+                           for inverter_id, peak_power in peak_powers.items()))
+
+async def do_regulation(regulation_factor, dry_run):
+    peak_powers = await read_openems_channel_values('MaxApparentPower')
+    openems_setpoints = {}
+    writes = []
     for inverter in inverter_ids:
         if inverter["type"] == "OPENEMS":
-            peak_power = get_peak_power(inverter["id"])
+            peak_power = peak_powers[inverter["id"]]
+            if peak_power is None:
+                log_message(f"No peak power for {inverter['id']}, skipping regulation.")
+                continue
             value_to_write = regulation_factor * peak_power
             if dry_run:
                 log_message('Dry RUN: Value would be: ' + str(value_to_write))
             else:
-                write_channel_value(inverter["id"], 'SetActivePower', value_to_write)
+                openems_setpoints[inverter["id"]] = peak_power
         elif inverter["type"] == "REFU":
             if dry_run:
                 log_message('Dry RUN: Would call set_current_power_refu with: ' + str(inverter["id"]) + ', ' + str(regulation_factor))
             else:
-                set_current_power_refu(inverter["id"], regulation_factor)
+                writes.append(setpoint_dispatcher.dispatch_async(inverter["id"], regulation_factor,
+                                                          functools.partial(set_current_power_refu, inverter["id"])))
+
+    if openems_setpoints:
+        writes.append(dispatch_openems_setpoints(regulation_factor, openems_setpoints))
+    await asyncio.gather(*writes)
 
 # Hauptausführung
 if __name__ == '__main__':
     outputs = Mod2AO()
-    scheduler = sched.scheduler(time.time, time.sleep)
-    scheduler.enter(0, 1, main)
-    scheduler.enter(0, 1, regulate_direktvermarkter)
-    scheduler.run()
+    asyncio.run(run())
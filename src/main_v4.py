@@ -0,0 +1,46 @@
+import asyncio
+
+from widgetlords.pi_spi import Mod2AO
+
+import main_v3 as poller
+import pymodbus_server_v5 as server
+
+# Poller und Modbus-Server in einem Prozess: Telemetrie und Regelung greifen direkt auf den Datenspeicher des Servers zu,
+# statt über Modbus TCP mit dem Server auf demselben Rechner zu sprechen. Konfiguration wie in main_v3 und pymodbus_server_v5.
+direktvermarkter_unit = 5  # Unit-ID in server_config.SERVER_UNITS
+
+logger = server.logger
+unit = server.units[direktvermarkter_unit]
+# Wird in run() angelegt und vom Callback des Holding-Registers gesetzt
+regulation_wakeup = None
+
+def on_holding_write(changed):
+    # Schreibzugriffe des Direktvermarkters kommen über den Modbus-Server im selben Event-Loop an
+    if regulation_wakeup is not None and ('set_point' in changed or 'polling_activation' in changed):
+        regulation_wakeup.set()
+
+async def write_total_power(total_power):
+    # Wirkleistung direkt in die Input Register 0-1, ohne FC16-Anfrage und Spiegelung über Holding Register 0-1
+    unit.input_block.set_point('active_power', total_power)
+    logger.info(f"Unit {unit.unit_id}: Wirkleistung gesetzt: {total_power}")
+
+async def read_setpoint():
+    # Sollwertvorgabe und Abrufaktivierung aus demselben Registerabbild, keine Leseanfrage nötig
+    _, points = unit.holding_block.image
+    return points
+
+async def run():
+    global regulation_wakeup
+    # Neue Vorgaben lösen die Regelung sofort aus, sonst weiterhin alle regulation_interval Sekunden
+    regulation_wakeup = asyncio.Event()
+    unit.holding_block.listeners.append(on_holding_write)
+    try:
+        # Endet der Server, endet auch der Poller
+        await poller.run(write_total_power, read_setpoint, regulation_wakeup, services=[server.run_server()])
+    finally:
+        server.shutdown()
+
+# Hauptausführung
+if __name__ == '__main__':
+    poller.outputs = Mod2AO()
+    asyncio.run(run())
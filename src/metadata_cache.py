@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class MetadataCache:
+    """TTL-Cache für selten veränderliche Kanalwerte (z. B. MaxApparentPower), begrenzt auf `max_size` Einträge (LRU).
+
+    Die TTL wird pro Kanal festgelegt; Kanäle ohne TTL (z. B. ActivePower) werden nicht zwischengespeichert.
+    """
+
+    def __init__(self, ttls, max_size=256):
+        self.ttls = dict(ttls)
+        self.max_size = max_size
+        self.entries = OrderedDict()  # (component_id, channel) -> (value, expires_at)
+        self.lock = threading.Lock()
+
+    def is_cached_channel(self, channel):
+        return self.ttls.get(channel, 0) > 0
+
+    def get(self, component_id, channel):
+        key = (component_id, channel)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[1]:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, component_id, channel, value):
+        ttl = self.ttls.get(channel, 0)
+        if ttl <= 0 or value is None:
+            return
+        key = (component_id, channel)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_or_load(self, component_id, channel, loader):
+        value = self.get(component_id, channel)
+        if value is None:
+            value = loader()
+            self.put(component_id, channel, value)
+        return value
+
+    def invalidate(self, component_id=None, channel=None):
+        with self.lock:
+            for key in list(self.entries):
+                if (component_id is None or key[0] == component_id) and (channel is None or key[1] == channel):
+                    del self.entries[key]
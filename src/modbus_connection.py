@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+
+from pymodbus.exceptions import ConnectionException
+
+from retry_policy import RetryPolicy
+
+
+class ModbusConnectionManager:
+    """Langlebige Modbus-TCP-Verbindung mit Health-Check, automatischem Reconnect mit Backoff und Request-Timeout.
+
+    `client_factory` ist die ModbusTcpClient-Klasse der jeweils verwendeten pymodbus-Version.
+    `probe` ist optional eine Funktion client -> Antwort, mit der eine länger ungenutzte Verbindung geprüft wird.
+    """
+
+    def __init__(self, client_factory, host, port=502, timeout=3.0, probe=None, health_check_interval=30.0,
+                 min_reconnect_delay=0.5, max_reconnect_delay=30.0, retry_policy=None):
+        self.client_factory = client_factory
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.probe = probe
+        self.health_check_interval = health_check_interval
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.retry_policy = retry_policy or RetryPolicy(attempts=2, base_delay=0.2, max_delay=1.0,
+                                                        retry_on=(ConnectionException, OSError))
+        self.client = None
+        self.last_success = 0.0
+        self.reconnect_delay = min_reconnect_delay
+        self.next_connect_at = 0.0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self.next_connect_at:
+            raise ConnectionException(f"Reconnect to {self.host}:{self.port} delayed for {self.next_connect_at - now:.1f}s")
+        if self.client is None:
+            self.client = self.client_factory(self.host, port=self.port, timeout=self.timeout)
+        if not self.client.connect():
+            # Exponentieller Backoff zwischen Verbindungsversuchen
+            self.next_connect_at = now + self.reconnect_delay
+            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+            raise ConnectionException(f"Failed to connect to {self.host}:{self.port}")
+        self.reconnect_delay = self.min_reconnect_delay
+        self.next_connect_at = 0.0
+        self.last_success = time.monotonic()
+
+    def _ensure_connected(self):
+        if self.client is None or not self.client.is_socket_open():
+            self._connect()
+        elif self.probe is not None and time.monotonic() - self.last_success > self.health_check_interval:
+            response = self.probe(self.client)
+            if response is None or response.isError():
+                raise ConnectionException(f"Health check against {self.host}:{self.port} failed")
+
+    def _drop(self):
+        if self.client is not None:
+            self.client.close()
+
+    def _attempt(self, operation):
+        with self.lock:
+            try:
+                self._ensure_connected()
+                result = operation(self.client)
+            except (ConnectionException, OSError):
+                self._drop()
+                raise
+            self.last_success = time.monotonic()
+            return result
+
+    def execute(self, operation):
+        """Führt `operation(client)` auf der bestehenden Verbindung aus und baut sie bei Verbindungsfehlern neu auf."""
+        return self.retry_policy.call(self._attempt, operation)
+
+    @property
+    def connected(self):
+        return self.client is not None and self.client.is_socket_open()
+
+    def close(self):
+        with self.lock:
+            self._drop()
+            self.client = None
+
+
+class AsyncModbusConnectionManager(ModbusConnectionManager):
+    """Asyncio-Variante für AsyncModbusTcpClient: jede Anfrage hat ein eigenes Timeout und blockiert den Event-Loop nicht.
+
+    `probe` ist hier eine Coroutine-Funktion client -> Antwort.
+    """
+
+    def __init__(self, client_factory, host, port=502, timeout=3.0, probe=None, health_check_interval=30.0,
+                 min_reconnect_delay=0.5, max_reconnect_delay=30.0, retry_policy=None):
+        super().__init__(client_factory, host, port, timeout, probe, health_check_interval,
+                         min_reconnect_delay, max_reconnect_delay, retry_policy)
+        self.lock = None  # asyncio.Lock, wird im laufenden Event-Loop angelegt
+
+    async def _connect(self):
+        now = time.monotonic()
+        if now < self.next_connect_at:
+            raise ConnectionException(f"Reconnect to {self.host}:{self.port} delayed for {self.next_connect_at - now:.1f}s")
+        if self.client is None:
+            # reconnect_delay=0: pymodbus soll nicht selbst neu verbinden, der Backoff liegt hier
+            self.client = self.client_factory(self.host, port=self.port, timeout=self.timeout, reconnect_delay=0)
+        if not await asyncio.wait_for(self.client.connect(), self.timeout):
+            self.next_connect_at = now + self.reconnect_delay
+            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+            raise ConnectionException(f"Failed to connect to {self.host}:{self.port}")
+        self.reconnect_delay = self.min_reconnect_delay
+        self.next_connect_at = 0.0
+        self.last_success = time.monotonic()
+
+    async def _ensure_connected(self):
+        if self.client is None or not self.client.connected:
+            await self._connect()
+        elif self.probe is not None and time.monotonic() - self.last_success > self.health_check_interval:
+            response = await asyncio.wait_for(self.probe(self.client), self.timeout)
+            if response is None or response.isError():
+                raise ConnectionException(f"Health check against {self.host}:{self.port} failed")
+
+    async def _attempt(self, operation):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            try:
+                await self._ensure_connected()
+                result = await asyncio.wait_for(operation(self.client), self.timeout)
+            except (ConnectionException, OSError, asyncio.TimeoutError):
+                # Nach einem Timeout können noch späte Antworten eintreffen, daher Verbindung verwerfen
+                self._drop()
+                raise
+            self.last_success = time.monotonic()
+            return result
+
+    async def execute(self, operation):
+        """Führt die Coroutine `operation(client)` mit Timeout aus und baut die Verbindung bei Fehlern neu auf."""
+        return await self.retry_policy.call_async(self._attempt, operation)
+
+    @property
+    def connected(self):
+        return self.client is not None and self.client.connected
+
+    def close(self):
+        self._drop()
+        self.client = None
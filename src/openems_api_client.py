@@ -1,46 +1,153 @@
 import json
 
 import requests
+from requests.adapters import HTTPAdapter
 
 import variables
+from metadata_cache import MetadataCache
+from retry_policy import CircuitBreakerRegistry, CircuitOpenError, RetryPolicy
 
 
-def get_current_power(inverter_id):
-    try:
-        url = f'http://x:admin@{variables.modbus_tcp_ip}:8084/rest/channel/{inverter_id}/ActivePower'
-        response = requests.get(url)
-        response_dict = response.json()
+class OpenEmsClient:
+    """REST-Client für das OpenEMS Edge mit Keep-Alive-Verbindungspool, festen URLs und Timeouts."""
+
+    def __init__(self, host, port=8084, username='x', password='admin', timeout=(2.0, 5.0), pool_size=10,
+                 retry_policy=None, breakers=None, cache=None):
+        self.base_url = f'http://{host}:{port}/rest/channel'
+        # (connect, read) in Sekunden; ohne Timeout blockiert ein hängendes Edge für immer
+        self.timeout = timeout
+        self.retry_policy = retry_policy
+        self.breakers = breakers
+        # Optionaler MetadataCache für selten veränderliche Kanäle
+        self.cache = cache
+        self.urls = {}
+
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+
+    def channel_url(self, component_id, channel):
+        key = (component_id, channel)
+        url = self.urls.get(key)
+        if url is None:
+            url = f'{self.base_url}/{component_id}/{channel}'
+            self.urls[key] = url
+        return url
+
+    def _call(self, component_id, fn, *args):
+        if self.retry_policy is None:
+            return fn(*args)
+        breaker = self.breakers.get(component_id) if self.breakers is not None else None
+        return self.retry_policy.call(fn, *args, breaker=breaker)
+
+    def _get(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        return response.json()
+
+    def _post(self, url, value):
+        headers = {'Content-Type': 'application/json'}
+        response = self.session.post(url, headers=headers, data=json.dumps({'value': value}), timeout=self.timeout)
+        if response.status_code != 200:
+            # Als Fehler melden, damit RetryPolicy und CircuitBreaker den Schreibversuch als gescheitert werten
+            raise requests.HTTPError(f"{response.status_code} {response.text}", response=response)
+        return response.json()['value']
+
+    def read_channel(self, component_id, channel):
+        if self.cache is not None and self.cache.is_cached_channel(channel):
+            return self.cache.get_or_load(component_id, channel, lambda: self._read_channel(component_id, channel))
+        return self._read_channel(component_id, channel)
+
+    def _read_channel(self, component_id, channel):
+        response_dict = self._call(component_id, self._get, self.channel_url(component_id, channel))
         return response_dict['value']
-    except Exception as e:
-        print(f"Error getting current power: {e}")
+
+    def read_channels(self, component_pattern, channel, component_ids=None):
+        """Liest einen Kanal aller Komponenten, die auf den Regex `component_pattern` passen, mit einer Anfrage.
+
+        Liefert {component_id: value}, z. B. für 'meter.*' und 'ActivePower'. Bei zwischengespeicherten Kanälen
+        wird jeder Wert einzeln pro Komponente abgelegt; aus dem Cache geantwortet wird nur, wenn für alle
+        `component_ids` ein Wert vorliegt.
+        """
+        if self.cache is None or not self.cache.is_cached_channel(channel):
+            return self._read_channels(component_pattern, channel)
+        if component_ids is not None:
+            values = {component_id: self.cache.get(component_id, channel) for component_id in component_ids}
+            if None not in values.values():
+                return values
+        values = self._read_channels(component_pattern, channel)
+        for component_id, value in values.items():
+            self.cache.put(component_id, channel, value)
+        return values
+
+    def _read_channels(self, component_pattern, channel):
+        response_list = self._call(component_pattern, self._get, self.channel_url(component_pattern, channel))
+        return {item['address'].split('/', 1)[0]: item['value'] for item in response_list}
+
+    def get_channel_values(self, component_pattern, channel, component_ids=None):
+        try:
+            return self.read_channels(component_pattern, channel, component_ids)
+        except CircuitOpenError:
+            print(f"Skipping {component_pattern}, circuit breaker is open.")
+            return None
+        except Exception as e:
+            print(f"Error reading {component_pattern}/{channel}: {e}")
+            return None
+
+    def get_current_power(self, inverter_id):
+        try:
+            return self.read_channel(inverter_id, 'ActivePower')
+        except CircuitOpenError:
+            print(f"Skipping {inverter_id}, circuit breaker is open.")
+            return None
+        except Exception as e:
+            print(f"Error getting current power: {e}")
+            return None
+
+    def get_peak_power(self, inverter_id):
+        try:
+            return self.read_channel(inverter_id, 'MaxApparentPower')
+        except CircuitOpenError:
+            print(f"Skipping {inverter_id}, circuit breaker is open.")
+            return None
+        except Exception as e:
+            print(f"Error getting peak power: {e}")
+            return None
+
+    def write_channel_value(self, inverter_id, channel, value):
+        try:
+            value = self._call(inverter_id, self._post, self.channel_url(inverter_id, channel), value)
+            if self.cache is not None:
+                self.cache.invalidate(inverter_id, channel)
+            return value
+        except CircuitOpenError:
+            print(f"Skipping {inverter_id}, circuit breaker is open.")
+        except Exception as e:
+            print(f"Error updating channel value: {e}")
         return None
 
+    def close(self):
+        self.session.close()
+
+
+# Verbindungsfehler, Timeouts und abgelehnte Schreibvorgänge werden wiederholt und vom CircuitBreaker gezählt
+retry_policy = RetryPolicy(attempts=3, base_delay=0.2, max_delay=2.0, retry_on=(requests.RequestException,))
+breakers = CircuitBreakerRegistry(failure_threshold=5, reset_timeout=30.0)
+metadata_cache = MetadataCache({'MaxApparentPower': 3600.0})
+client = OpenEmsClient(variables.modbus_tcp_ip, retry_policy=retry_policy, breakers=breakers, cache=metadata_cache)
+
+
+def get_current_power(inverter_id):
+    return client.get_current_power(inverter_id)
+
+
+def get_channel_values(component_pattern, channel, component_ids=None):
+    return client.get_channel_values(component_pattern, channel, component_ids)
+
 
 def get_peak_power(inverter_id):
-    try:
-        url = f'http://x:admin@{variables.modbus_tcp_ip}:8084/rest/channel/{inverter_id}/MaxApparentPower'
-        response = requests.get(url)
-        response_dict = response.json()
-        return response_dict['value']
-    except Exception as e:
-        print(f"Error getting peak power: {e}")
-        return None
+    return client.get_peak_power(inverter_id)
 
 
 def write_channel_value(inverter_id, channel, value):
-    try:
-        url = f'http://x:admin@{variables.modbus_tcp_ip}:8084/rest/channel/{inverter_id}/{channel}'
-        headers = {'Content-Type': 'application/json'}
-        payload = json.dumps({'value': value})
-        response = requests.post(url, headers=headers, data=payload, auth=('admin', 'x'))
-
-        if response.status_code == 200:
-            response_dict = response.json()
-            return response_dict['value']
-        else:
-            print(f"Error updating channel value: {response.text}")
-            return None
-
-    except Exception as e:
-        print(f"Error updating channel value: {e}")
-    return None
+    return client.write_channel_value(inverter_id, channel, value)
@@ -0,0 +1,150 @@
+import asyncio
+
+import aiohttp
+
+from retry_policy import CircuitOpenError
+
+
+class AsyncOpenEmsClient:
+    """Asyncio-Variante des OpenEmsClient; höchstens `concurrency` Anfragen laufen gleichzeitig."""
+
+    def __init__(self, host, port=8084, username='x', password='admin', timeout=5.0, concurrency=10,
+                 retry_policy=None, breakers=None, cache=None):
+        self.base_url = f'http://{host}:{port}/rest/channel'
+        self.auth = aiohttp.BasicAuth(username, password)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.concurrency = concurrency
+        self.retry_policy = retry_policy
+        self.breakers = breakers
+        self.cache = cache
+        self.session = None
+        self.semaphore = None
+
+    def channel_url(self, component_id, channel):
+        return f'{self.base_url}/{component_id}/{channel}'
+
+    def _session(self):
+        # Session und Semaphore gehören zum laufenden Event-Loop und werden daher erst hier angelegt
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self.session = aiohttp.ClientSession(connector=connector, auth=self.auth, timeout=self.timeout)
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.session
+
+    async def _call(self, component_id, fn, *args):
+        if self.retry_policy is None:
+            return await fn(*args)
+        breaker = self.breakers.get(component_id) if self.breakers is not None else None
+        return await self.retry_policy.call_async(fn, *args, breaker=breaker)
+
+    async def _get(self, url):
+        session = self._session()
+        async with self.semaphore:
+            async with session.get(url) as response:
+                return await response.json(content_type=None)
+
+    async def _post(self, url, value):
+        session = self._session()
+        async with self.semaphore:
+            async with session.post(url, json={'value': value}) as response:
+                if response.status != 200:
+                    # Als Fehler melden, damit RetryPolicy und CircuitBreaker den Schreibversuch als gescheitert werten
+                    raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status,
+                                                      message=await response.text())
+                response_dict = await response.json(content_type=None)
+                return response_dict['value']
+
+    async def _read_channel(self, component_id, channel):
+        response_dict = await self._call(component_id, self._get, self.channel_url(component_id, channel))
+        return response_dict['value']
+
+    async def _read_channels(self, component_pattern, channel):
+        response_list = await self._call(component_pattern, self._get, self.channel_url(component_pattern, channel))
+        return {item['address'].split('/', 1)[0]: item['value'] for item in response_list}
+
+    async def _cached(self, component_id, channel, load):
+        if self.cache is None or not self.cache.is_cached_channel(channel):
+            return await load(component_id, channel)
+        value = self.cache.get(component_id, channel)
+        if value is None:
+            value = await load(component_id, channel)
+            self.cache.put(component_id, channel, value)
+        return value
+
+    async def read_channel(self, component_id, channel):
+        return await self._cached(component_id, channel, self._read_channel)
+
+    async def read_channels(self, component_pattern, channel, component_ids=None):
+        """Wie OpenEmsClient.read_channels: ein Kanal aller zum Regex passenden Komponenten, {component_id: value}.
+
+        Zwischengespeichert wird pro Komponente, nicht das Sammelergebnis.
+        """
+        if self.cache is None or not self.cache.is_cached_channel(channel):
+            return await self._read_channels(component_pattern, channel)
+        if component_ids is not None:
+            values = {component_id: self.cache.get(component_id, channel) for component_id in component_ids}
+            if None not in values.values():
+                return values
+        values = await self._read_channels(component_pattern, channel)
+        for component_id, value in values.items():
+            self.cache.put(component_id, channel, value)
+        return values
+
+    async def get_channel_values(self, component_pattern, channel, component_ids=None):
+        try:
+            return await self.read_channels(component_pattern, channel, component_ids)
+        except CircuitOpenError:
+            print(f"Skipping {component_pattern}, circuit breaker is open.")
+            return None
+        except Exception as e:
+            print(f"Error reading {component_pattern}/{channel}: {e}")
+            return None
+
+    async def get_current_power(self, inverter_id):
+        try:
+            return await self.read_channel(inverter_id, 'ActivePower')
+        except CircuitOpenError:
+            print(f"Skipping {inverter_id}, circuit breaker is open.")
+            return None
+        except Exception as e:
+            print(f"Error getting current power: {e}")
+            return None
+
+    async def get_peak_power(self, inverter_id):
+        try:
+            return await self.read_channel(inverter_id, 'MaxApparentPower')
+        except CircuitOpenError:
+            print(f"Skipping {inverter_id}, circuit breaker is open.")
+            return None
+        except Exception as e:
+            print(f"Error getting peak power: {e}")
+            return None
+
+    async def write_channel_value(self, inverter_id, channel, value):
+        try:
+            result = await self._call(inverter_id, self._post, self.channel_url(inverter_id, channel), value)
+            if self.cache is not None:
+                self.cache.invalidate(inverter_id, channel)
+            return result
+        except CircuitOpenError:
+            print(f"Skipping {inverter_id}, circuit breaker is open.")
+        except Exception as e:
+            print(f"Error updating channel value: {e}")
+        return None
+
+    async def read_many(self, addresses):
+        """Liest mehrere (component_id, channel)-Paare parallel; Fehler ergeben None."""
+        values = await asyncio.gather(*(self._read_or_none(component_id, channel) for component_id, channel in addresses))
+        return dict(zip(addresses, values))
+
+    async def _read_or_none(self, component_id, channel):
+        try:
+            return await self.read_channel(component_id, channel)
+        except Exception as e:
+            print(f"Error reading {component_id}/{channel}: {e}")
+            return None
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+import uuid
+
+import aiohttp
+
+
+class LatestValueStore:
+    """Letzter empfangener Wert pro Kanaladresse ('meter2/ActivePower') mit Empfangszeitpunkt."""
+
+    def __init__(self):
+        self.values = {}  # address -> (value, timestamp)
+
+    def update(self, channels):
+        now = time.monotonic()
+        for address, value in channels.items():
+            self.values[address] = (value, now)
+
+    def get(self, address, max_age):
+        entry = self.values.get(address)
+        if entry is None or time.monotonic() - entry[1] > max_age:
+            return None
+        return entry[0]
+
+    def fresh_values(self, addresses, max_age):
+        """Liefert {address: value}, oder None, sobald eine Adresse fehlt oder älter als `max_age` ist."""
+        result = {}
+        for address in addresses:
+            value = self.get(address, max_age)
+            if value is None:
+                return None
+            result[address] = value
+        return result
+
+    def clear(self):
+        self.values.clear()
+
+
+class OpenEmsSubscription:
+    """Abonniert Kanäle über die JSON-RPC-Websocket-Schnittstelle des OpenEMS Edge und hält sie im LatestValueStore aktuell.
+
+    Bricht der Stream ab, wird nach `reconnect_delay` Sekunden neu verbunden; bis dahin veralten die Werte im Store
+    und die Aufrufer fallen auf REST zurück.
+    """
+
+    def __init__(self, host, channels, port=8085, password='admin', edge_id='0', reconnect_delay=5.0, store=None):
+        self.url = f'ws://{host}:{port}'
+        self.channels = list(channels)
+        self.password = password
+        self.edge_id = edge_id
+        self.reconnect_delay = reconnect_delay
+        self.store = store if store is not None else LatestValueStore()
+        self.connected = False
+
+    @staticmethod
+    def _request(method, params):
+        return {'jsonrpc': '2.0', 'id': str(uuid.uuid4()), 'method': method, 'params': params}
+
+    async def _call(self, ws, request):
+        await ws.send_json(request)
+        # Antworten auf andere Anfragen und Benachrichtigungen bis zur passenden Antwort verarbeiten
+        while True:
+            message = await ws.receive_json()
+            if message.get('id') == request['id']:
+                if 'error' in message:
+                    raise ConnectionError(f"OpenEMS JSON-RPC error: {message['error']}")
+                return message.get('result')
+            self._handle(message)
+
+    def _handle(self, message):
+        if message.get('method') == 'edgeRpc':
+            message = message.get('params', {}).get('payload', {})
+        if message.get('method') == 'currentData':
+            self.store.update(message.get('params', {}))
+
+    async def _stream(self, session):
+        async with session.ws_connect(self.url, heartbeat=30) as ws:
+            await self._call(ws, self._request('authenticateWithPassword', {'password': self.password}))
+            subscribe = self._request('subscribeChannels', {'count': 0, 'channels': self.channels})
+            await self._call(ws, self._request('edgeRpc', {'edgeId': self.edge_id, 'payload': subscribe}))
+            self.connected = True
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    self._handle(json.loads(msg.data))
+                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    break
+
+    async def run(self):
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    await self._stream(session)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"OpenEMS subscription failed: {e}")
+                finally:
+                    self.connected = False
+                await asyncio.sleep(self.reconnect_delay)
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from refu_client import nameplate_parameter_set
+
+# Plausibilitätsgrenze für die gelesene Nennleistung in Watt
+MAX_PLAUSIBLE_PEAK_POWER = 100000
+
+
+class PeakPowerCache:
+    """Nennleistung der REFU-Wechselrichter, einmal gelesen und mit langer TTL im Hintergrund aktualisiert.
+
+    Ohne `parameter` (Parameter-ID der Nennleistung laut REFU-Parameterliste) wird nichts gelesen und `total`
+    rechnet für jeden Wechselrichter mit der übergebenen Standard-Nennleistung.
+    """
+
+    def __init__(self, refu_client, log, parameter=None, ttl=3600.0, refresh_interval=60.0):
+        self.refu_client = refu_client
+        self.log = log
+        self.parameter_set = nameplate_parameter_set(parameter) if parameter is not None else None
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.entries = {}  # host -> (peak_power, timestamp)
+
+    def get(self, host):
+        entry = self.entries.get(host)
+        return entry[0] if entry is not None else None
+
+    def total(self, hosts, default_peak_power):
+        """Summe über die übergebenen (aktiven) Hosts; noch unbekannte Hosts zählen mit `default_peak_power`."""
+        total_power = 0
+        for host in hosts:
+            peak_power = self.get(host)
+            total_power += peak_power if peak_power is not None else default_peak_power
+        return total_power
+
+    async def read(self, host):
+        nameplate = await self.refu_client.read(host, self.parameter_set)
+        peak_power = nameplate.peak_power
+        if peak_power is None or not 0 < peak_power <= MAX_PLAUSIBLE_PEAK_POWER:
+            raise ValueError(f"Implausible peak power {peak_power} from {host}")
+        self.entries[host] = (peak_power, time.monotonic())
+        return peak_power
+
+    async def refresh(self, hosts):
+        if self.parameter_set is None:
+            return
+        now = time.monotonic()
+        stale = [host for host in hosts if host not in self.entries or now - self.entries[host][1] >= self.ttl]
+        results = await asyncio.gather(*(self.read(host) for host in stale), return_exceptions=True)
+        for host, result in zip(stale, results):
+            if isinstance(result, Exception):
+                self.log(f"Error reading peak power from {host}: {result}")
+
+    async def run(self, hosts_provider):
+        """Hintergrund-Task: aktualisiert regelmäßig die abgelaufenen Einträge der von `hosts_provider` gelieferten Hosts."""
+        if self.parameter_set is None:
+            # Beim Start einmal melden, dass `total` nur mit der Standard-Nennleistung rechnet
+            self.log("REFU peak power discovery disabled: no nominal power parameter configured, "
+                     "using the default peak power for every inverter")
+            return
+        while True:
+            try:
+                await self.refresh(hosts_provider())
+            except Exception as e:
+                self.log(f"Error refreshing peak power cache: {e}")
+            await asyncio.sleep(self.refresh_interval)
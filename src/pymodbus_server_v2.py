@@ -1,3 +1,4 @@
+import functools
 import logging
 import struct
 from pymodbus.server.sync import StartTcpServer
@@ -10,24 +11,13 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
-# Initialisiere die Datenblöcke und den Kontext
-store = ModbusSlaveContext(
-    hr=ModbusSequentialDataBlock(0, [0]*20)  # 20 Register für Holding-Registers
-)
-context = ModbusServerContext(slaves=store, single=True)
+# Units dieses Servers (Unit-ID -> UnitConfig) aus server_config; v2 nutzt nur die Unit-IDs, das Registerlayout ist fest
+from server_config import SERVER_UNITS
 
 # Funktion zum Setzen von 32-Bit Float-Werten
-def set_float(context, address, value):
+def set_float(store, address, value):
     packed_value = struct.unpack('>HH', struct.pack('>f', value))
-    context[0].setValues(3, address, packed_value)
-
-set_float(context, 0, 0.0)  # Wirkleistung
-set_float(context, 2, 100.0)  # Leistungsvorgabe des EVU
-set_float(context, 4, 0.0)  # Windgeschwindigkeit
-context[0].setValues(3, 6, [0])  # Abrufmeldung (Bool)
-context[0].setValues(3, 8, [0])  # Betriebsmeldung (Bool)
-set_float(context, 10, 0.0)  # Sollwertvorgabe
-context[0].setValues(3, 12, [0])  # Bereitschaftsmeldung (Bool)
+    store.setValues(3, address, packed_value)
 
 # Mapping der Adressen zu den Datentypen
 address_map = {
@@ -41,34 +31,55 @@ address_map = {
 }
 
 # Callback-Funktion zum Protokollieren der geschriebenen Werte
-def on_write_data(address, values):
+def on_write_data(unit_id, address, values):
     i = 0
     while i < len(values):
         actual_address = address + i
         if address_map.get(actual_address) == 'float':
             if i + 1 < len(values):
                 float_value = struct.unpack('>f', struct.pack('>HH', values[i], values[i+1]))[0]
-                logger.info(f"Register {actual_address} geschrieben mit Wert: {float_value} (Float)")
+                logger.info(f"Unit {unit_id}: Register {actual_address} geschrieben mit Wert: {float_value} (Float)")
                 i += 2  # Float nimmt 2 Register ein
             else:
-                logger.warning(f"Unvollständige Float-Daten bei Adresse {actual_address}")
+                logger.warning(f"Unit {unit_id}: Unvollständige Float-Daten bei Adresse {actual_address}")
                 i += 1
         elif address_map.get(actual_address) == 'bool':
             bool_value = bool(values[i])
-            logger.info(f"Register {actual_address} geschrieben mit Wert: {bool_value} (Boolean)")
+            logger.info(f"Unit {unit_id}: Register {actual_address} geschrieben mit Wert: {bool_value} (Boolean)")
             i += 1
         else:
-            logger.warning(f"Unbekannter Datentyp bei Adresse {actual_address}")
+            logger.warning(f"Unit {unit_id}: Unbekannter Datentyp bei Adresse {actual_address}")
             i += 1
 
 # Override der setValues-Methode, um Änderungen zu protokollieren
-original_set_values = store.setValues
+original_set_values = ModbusSlaveContext.setValues
+
+def logging_set_values(store, unit_id, framer, address, values):
+    on_write_data(unit_id, address, values)
+    return original_set_values(store, framer, address, values)
 
-def logging_set_values(framer, address, values):
-    on_write_data(address, values)
-    return original_set_values(framer, address, values)
+def create_unit_store(unit_id):
+    """Eigener Registersatz einer Unit mit initialisierten Datenpunkten."""
+    store = ModbusSlaveContext(
+        hr=ModbusSequentialDataBlock(0, [0]*20)  # 20 Register für Holding-Registers
+    )
+    set_float(store, 0, 0.0)  # Wirkleistung
+    set_float(store, 2, 100.0)  # Leistungsvorgabe des EVU
+    set_float(store, 4, 0.0)  # Windgeschwindigkeit
+    store.setValues(3, 6, [0])  # Abrufmeldung (Bool)
+    store.setValues(3, 8, [0])  # Betriebsmeldung (Bool)
+    set_float(store, 10, 0.0)  # Sollwertvorgabe
+    store.setValues(3, 12, [0])  # Bereitschaftsmeldung (Bool)
+    store.setValues = functools.partial(logging_set_values, store, unit_id)
+    return store
 
-store.setValues = logging_set_values
+# Initialisiere die Datenblöcke und den Kontext; die Unit einer Anfrage wird per Dict-Lookup gefunden
+stores = {unit_id: create_unit_store(unit_id) for unit_id in SERVER_UNITS}
+if len(stores) == 1:
+    # Eine einzelne Unit beantwortet wie bisher Anfragen an jede Unit-ID
+    context = ModbusServerContext(slaves=next(iter(stores.values())), single=True)
+else:
+    context = ModbusServerContext(slaves=stores, single=False)
 
 # Modbus-Server-Identifikation
 identity = ModbusDeviceIdentification()
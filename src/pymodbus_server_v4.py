@@ -1,117 +1,93 @@
 import logging
-import struct
 import asyncio
+import functools
 import socket
-from pymodbus.server import StartAsyncTcpServer
+from pymodbus.server import ModbusTcpServer
 from pymodbus.device import ModbusDeviceIdentification
-from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
-from pymodbus.datastore import ModbusSequentialDataBlock
-from pymodbus.constants import Endian
-from pymodbus.payload import BinaryPayloadBuilder, BinaryPayloadDecoder
+from pymodbus.datastore import ModbusSlaveContext
 
-# Logging-Konfiguration
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+from register_datastore import build_server_context
+from server_config import SERVER_UNITS
+from server_logging import LogSampler, setup_logging
+from server_metrics import ServerMetrics, serve_metrics
+
+# Logging-Konfiguration: Formatierung und Ausgabe laufen in einem Hintergrund-Thread, nicht im Event-Loop
+log_level = logging.INFO
+log_listener = setup_logging(log_level)
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-# Initialisiere die Datenblöcke und den Kontext
-store = ModbusSlaveContext(
-    ir=ModbusSequentialDataBlock(0, [0]*14),  # Input Register (0-13)
-    hr=ModbusSequentialDataBlock(0, [0]*14)   # Holding Register (0-13)
-)
-context = ModbusServerContext(slaves=store, single=True)
-
-# Funktion zum Setzen von 32-Bit Float-Werten
-def set_float(context, address, value, fc=3):
-    builder = BinaryPayloadBuilder(byteorder=Endian.Big, wordorder=Endian.Big)
-    builder.add_32bit_float(value)
-    payload = builder.to_registers()
-    context[0].setValues(fc, address, payload)
-    logger.info(f"Float-Wert gesetzt: Adresse={address}, Wert={value}, Funktion Code={fc}")
-
-# Funktion zum Setzen von Bool-Werten
-def set_bool(context, address, bit, value, fc=3):
-    register = context[0].getValues(fc, address, 1)[0]
-    old_value = bool(register & (1 << bit))
-    if value:
-        register |= (1 << bit)
-    else:
-        register &= ~(1 << bit)
-    context[0].setValues(fc, address, [register])
-    logger.info(f"Bool-Wert gesetzt: Adresse={address}, Bit={bit}, Alter Wert={old_value}, Neuer Wert={value}, Funktion Code={fc}")
-
-# Initialisierung der Datenpunkte
-set_float(context, 0, 0.0, fc=4)  # Wirkleistung (Input Register)
-set_float(context, 2, 100.0, fc=4)  # Leistungsvorgabe des EVU (Input Register)
-set_float(context, 4, 0.0, fc=4)  # Windgeschwindigkeit (Input Register)
-set_bool(context, 6, 0, False, fc=4)  # Abrufmeldung (Input Register)
-set_bool(context, 6, 8, False, fc=4)  # Betriebsmeldung (Input Register)
-set_bool(context, 6, 12, False, fc=4)  # Bereitschaftsmeldung (Input Register)
-set_float(context, 8, 0.0, fc=4)  # Verfügbare Leistung (Input Register)
-set_float(context, 10, 0.0)  # Sollwertvorgabe (Holding Register)
-set_bool(context, 12, 0, False)  # Abrufaktivierung (Holding Register)
-
-# Mapping der Adressen zu den Datentypen
-address_map = {
-    0: ('float', 4),
-    2: ('float', 4),
-    4: ('float', 4),
-    6: ('bool', 4),
-    8: ('float', 4),
-    10: ('float', 3),
-    12: ('bool', 3)
-}
+# Meldungen pro Anfrage höchstens einmal pro Sekunde und Adresse, abgelehnte Schreibversuche alle 10 Sekunden
+request_log = LogSampler(logger, interval=1.0)
+reject_log = LogSampler(logger, interval=10.0, level=logging.WARNING)
+
+# Anfrage-Metriken, abrufbar als Prometheus-Text unter http://127.0.0.1:9502/ und im Input-Register-Diagnoseblock ab 100
+metrics = ServerMetrics()
+metrics_port = 9502
+metrics_interval = 1.0  # Sekunden zwischen zwei Aktualisierungen des Diagnoseblocks
+
+# Schreibvorgänge veröffentlichen ein neues Registerabbild, Leser sehen nie halb geschriebene Floats
+datastore_snapshots = True
+
+# Initialisiere die Datenblöcke und den Kontext; Units, RegisterMaps und Blockgrößen kommen aus server_config
+context, units = build_server_context(SERVER_UNITS, snapshot=datastore_snapshots)
 
 # Callback-Funktion zum Protokollieren der geschriebenen Werte
-def on_write_data(address, values):
-    i = 0
-    while i < len(values):
-        actual_address = address + i
-        data_type, fc = address_map.get(actual_address, (None, None))
-        if data_type == 'float':
-            if i + 1 < len(values):
-                decoder = BinaryPayloadDecoder.fromRegisters(values[i:i+2], byteorder=Endian.Big, wordorder=Endian.Big)
-                float_value = decoder.decode_32bit_float()
-                logger.info(f"Register {actual_address} geschrieben mit Wert: {float_value} (Float)")
-                i += 2  # Float nimmt 2 Register ein
-            else:
-                logger.warning(f"Unvollständige Float-Daten bei Adresse {actual_address}")
-                i += 1
-        elif data_type == 'bool':
-            for bit in [0, 8, 12]:
-                bool_value = bool(values[i] & (1 << bit))
-                logger.info(f"Register {actual_address}.{bit} geschrieben mit Wert: {bool_value} (Boolean)")
-            i += 1
-        else:
-            logger.warning(f"Unbekannter Datentyp bei Adresse {actual_address}")
-            i += 1
+def on_write_data(unit, fc, address, values):
+    # Die typisierten Werte hat der Datenblock beim Schreiben bereits dekodiert, hier wird nur noch protokolliert
+    register_type = unit.decode(fc)  # 'h' für Holding Register (FC 6/16/23), 'c' für Coils (FC 5/15)
+    key = (register_type, unit.unit_id, address)
+    if not request_log.enabled(key):
+        return
+    # `changed` gehört zum letzten Schreibvorgang auf den Holding-Block, bei Coils also zu einem früheren
+    if register_type == 'h' and unit.holding_block.changed:
+        request_log.log(key, "Unit %s: Schreibvorgang: Funktion Code=%s, Adresse=%s, Werte=%s, Datenpunkte=%s",
+                        unit.unit_id, fc, address, values, unit.holding_block.changed)
+    else:
+        request_log.log(key, "Unit %s: Schreibvorgang: Funktion Code=%s, Adresse=%s, Werte=%s, kein Datenpunkt der REGISTER_MAP",
+                        unit.unit_id, fc, address, values)
 
 # Override der setValues-Methode, um Änderungen zu protokollieren und Schreibzugriffe auf Input Register zu verhindern
-original_set_values = store.setValues
+original_set_values = ModbusSlaveContext.setValues
 
-def logging_set_values(fc_as_hex, address, values):
+def logging_set_values(unit, fc_as_hex, address, values):
     fc = fc_as_hex
     if fc == 4:  # Input Register
-        logger.warning(f"Schreibversuch auf Input Register bei Adresse {address} abgelehnt")
+        metrics.reject('input_register')
+        if reject_log.enabled(('i', unit.unit_id, address)):
+            reject_log.log(('i', unit.unit_id, address), "Unit %s: Schreibversuch auf Input Register bei Adresse %s abgelehnt",
+                           unit.unit_id, address)
         return False
     if address > 13:  # Anpassen, wenn Sie mehr als 14 Register haben
-        logger.warning(f"Schreibversuch auf ungültige Adresse {address} abgelehnt")
+        metrics.reject('invalid_address')
+        if reject_log.enabled(('h', unit.unit_id, address)):
+            reject_log.log(('h', unit.unit_id, address), "Unit %s: Schreibversuch auf ungültige Adresse %s abgelehnt",
+                           unit.unit_id, address)
         return False
-    logger.info(f"Schreibvorgang gestartet: Funktion Code={fc}, Adresse={address}, Werte={values}")
-    on_write_data(address, values)
-    result = original_set_values(fc_as_hex, address, values)
-    logger.info(f"Schreibvorgang abgeschlossen: Ergebnis={result}")
+    result = original_set_values(unit, fc_as_hex, address, values)
+    on_write_data(unit, fc, address, values)
     return result
 
-store.setValues = logging_set_values
-
-# Custom Read Handler
-def custom_read_handler(register_type, address, count):
-    values = context[0].getValues(register_type, address, count)
-    logger.info(f"Lesevorgang: Typ={register_type}, Adresse={address}, Anzahl={count}, Werte={values}")
+# Override der getValues-Methode, um Lesevorgänge zu protokollieren (pymodbus liest über async_getValues -> getValues)
+original_get_values = ModbusSlaveContext.getValues
+READ_FUNCTION_CODES = (1, 2, 3, 4, 23)
+
+def logging_get_values(unit, fc_as_hex, address, count=1):
+    values = original_get_values(unit, fc_as_hex, address, count)
+    # Schreibanfragen lesen für ihre Antwort ebenfalls, protokolliert werden nur Leseanfragen (FC 1-4, 23)
+    if fc_as_hex in READ_FUNCTION_CODES:
+        key = ('r', unit.unit_id, fc_as_hex, address, count)
+        if request_log.enabled(key):
+            # Typisierte Werte aus dem Datenblock, passend zum Datentyp jedes gelesenen Datenpunkts
+            request_log.log(key, "Unit %s: Lesevorgang: Funktion Code=%s, Adresse=%s, Anzahl=%s, Werte=%s, Datenpunkte=%s",
+                            unit.unit_id, fc_as_hex, address, count, values, unit.points_in(fc_as_hex, address, count))
     return values
 
-store.read = custom_read_handler
+for unit in units.values():
+    # Initialisierung der Datenpunkte mit den Startwerten der Unit
+    unit.set_points(SERVER_UNITS[unit.unit_id].defaults)
+    logger.info(f"Unit {unit.unit_id}: Startwerte gesetzt: {unit.input_block.typed}, {unit.holding_block.typed}")
+
+    unit.setValues = functools.partial(logging_set_values, unit)
+    unit.getValues = functools.partial(logging_get_values, unit)
 
 # Modbus-Server-Identifikation
 identity = ModbusDeviceIdentification()
@@ -131,19 +107,44 @@ async def heartbeat():
 # Statusreporter-Funktion
 async def status_reporter():
     while True:
-        ir_values = context[0].getValues(4, 0, 14)
-        hr_values = context[0].getValues(3, 0, 14)
-        logger.info(f"Server-Status: Aktiv. Aktuelle Input Register Werte: {ir_values}")
-        logger.info(f"Server-Status: Aktiv. Aktuelle Holding Register Werte: {hr_values}")
+        for unit in units.values():
+            # Rohregister und typisierte Werte aus demselben Abbild
+            ir_image, ir_typed = unit.input_block.image
+            hr_image, hr_typed = unit.holding_block.image
+            ir_offset = unit.input_block.offset
+            hr_offset = unit.holding_block.offset
+            ir_values = ir_image[ir_offset:ir_offset + 14]  # Protokolladressen 0-13
+            hr_values = hr_image[hr_offset:hr_offset + 14]  # Protokolladressen 0-13
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Aktuelle Input Register Werte: {ir_values}")
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Aktuelle Holding Register Werte: {hr_values}")
+            # Typisierte Werte direkt aus den Datenblöcken, ohne erneutes Dekodieren
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Input Register Datenpunkte: {ir_typed}")
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Holding Register Datenpunkte: {hr_typed}")
         await asyncio.sleep(300)  # Alle 5 Minuten
 
+# Diagnoseblock im Input Register aus den Metriken aktualisieren
+async def metrics_reporter():
+    while True:
+        diagnostics = metrics.diagnostics()
+        for unit in units.values():
+            # Alle Kennzahlen in einem Schreibvorgang, Leser sehen nie alte und neue Zähler gemischt;
+            # RegisterMaps ohne Diagnoseblock werden übersprungen
+            unit.input_block.set_points({name: value for name, value in diagnostics.items() if name in unit.input_block.slots})
+        await asyncio.sleep(metrics_interval)
+
 async def run_server():
     try:
-        server = await StartAsyncTcpServer(
-            context=context,
+        # Server direkt anlegen statt StartAsyncTcpServer, das erst beim Beenden zurückkehrt
+        server = ModbusTcpServer(
+            context,
             identity=identity,
-            address=("0.0.0.0", 502)
+            address=("0.0.0.0", 502),
+            request_tracer=metrics.trace_request,
+            response_manipulator=metrics.trace_response
         )
+        metrics.connections = server.active_connections
+        if not await server.listen():
+            raise OSError("Port 502 konnte nicht geöffnet werden")
         logger.info("Modbus-TCP-Server erfolgreich gestartet auf Port 502")
         
         # Überprüfe, ob der Server tatsächlich auf Port 502 hört
@@ -154,12 +155,19 @@ async def run_server():
             else:
                 logger.error(f"Server konnte nicht auf Port 502 hören. Fehlercode: {result}")
         
-        # Starte Heartbeat-Task und Status-Reporter
-        asyncio.create_task(heartbeat())
-        asyncio.create_task(status_reporter())
+        # Starte Heartbeat-Task, Status-Reporter und Metriken
+        tasks = [
+            asyncio.create_task(heartbeat()),
+            asyncio.create_task(status_reporter()),
+            asyncio.create_task(metrics_reporter()),
+            asyncio.create_task(serve_metrics(metrics, port=metrics_port)),
+        ]
         
-        while True:
-            await asyncio.sleep(1)
+        try:
+            await server.serving
+        finally:
+            for task in tasks:
+                task.cancel()
     except Exception as e:
         logger.error(f"Fehler beim Starten oder Ausführen des Servers: {e}")
         raise
@@ -172,6 +180,7 @@ async def main():
         logger.error(f"Kritischer Fehler beim Starten des Servers: {e}")
     finally:
         logger.info("Server wird beendet.")
+        log_listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,200 +1,115 @@
 import logging
-import struct
 import asyncio
+import functools
 import socket
-from pymodbus.server import StartAsyncTcpServer
+from pymodbus.server import ModbusTcpServer
 from pymodbus.device import ModbusDeviceIdentification
-from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
-from pymodbus.datastore import ModbusSequentialDataBlock
-from pymodbus.constants import Endian
-from pymodbus.payload import BinaryPayloadBuilder, BinaryPayloadDecoder
+from pymodbus.datastore import ModbusSlaveContext
 
-# Logging-Konfiguration
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-# Initialisiere die Datenblöcke und den Kontext
-store = ModbusSlaveContext(
-    ir=ModbusSequentialDataBlock(0, [0]*20),  # Input Register (0-19)
-    hr=ModbusSequentialDataBlock(0, [0]*20)   # Holding Register (0-19)
-)
-context = ModbusServerContext(slaves=store, single=True)
-
-def update_input_register(address, values):
-    """Interne Funktion zum Aktualisieren von Input Registern."""
-    try:
-        # Erhöhe die Adresse um 1 für das Input Register
-        input_address = address + 1
-        
-        # Schreibe die Werte in der ursprünglichen Reihenfolge
-        store.store['i'].setValues(input_address, values)
-        
-        logger.info(f"Input Register {input_address} intern aktualisiert mit Werten: {values}")
-        
-        # Verifiziere den geschriebenen Wert
-        written_values = store.store['i'].getValues(input_address, len(values))
-        logger.info(f"Verifizierung - Gelesene Werte aus Input Register {input_address}: {written_values}")
-        
-        # Dekodiere den Float-Wert für besseres Logging
-        if len(values) >= 2:
-            decoder = BinaryPayloadDecoder.fromRegisters(written_values, byteorder=Endian.BIG, wordorder=Endian.BIG)
-            float_value = decoder.decode_32bit_float()
-            logger.info(f"Dekodierter Float-Wert im Input Register: {float_value}")
-    except Exception as e:
-        logger.error(f"Fehler beim Aktualisieren des Input Registers {input_address}: {e}")
+from register_datastore import build_server_context
+from register_mirror import MirrorRule, RegisterMirror
+from server_config import SERVER_UNITS
+from server_logging import LogSampler, setup_logging
+from server_metrics import ServerMetrics, serve_metrics
 
-def logging_set_values(fc_as_hex, address, values):
-    fc = fc_as_hex
-    if fc == 4:  # Input Register
-        logger.warning(f"Schreibversuch auf Input Register bei Adresse {address} abgelehnt")
-        return False
-    if address >= 14:  # Erweitere den zulässigen Bereich auf 14 Adressen
-        logger.warning(f"Schreibversuch auf ungültige Adresse {address} abgelehnt")
-        return False
-    logger.info(f"Schreibvorgang gestartet: Funktion Code={fc}, Adresse={address}, Werte={values}")
-    on_write_data(address, values)
-    result = original_set_values(fc_as_hex, address, values)
-    
-    # Wenn in Holding Register 0 geschrieben wird (FC 16 oder FC 6), aktualisiere Input Register 0
-    if (fc == 16 or fc == 6) and address == 0:  # Preset Multiple Registers oder Preset Single Register
-        # Stelle sicher, dass wir beide Werte kopieren
-        update_input_register(0, values[:2])  # Kopiere die ersten zwei Register (für Float)
-        
-        # Verifiziere den Kopiervorgang
-        hr_values = context[0].getValues(fc, address, 2)
-        ir_values = store.store['i'].getValues(0, 2)
-        logger.info(f"Verifizierung - Holding Register Werte: {hr_values}, Input Register Werte: {ir_values}")
-
-    logger.info(f"Schreibvorgang abgeschlossen: Ergebnis={result}")
-    return result
+# Logging-Konfiguration: Formatierung und Ausgabe laufen in einem Hintergrund-Thread, nicht im Event-Loop
+log_level = logging.INFO
+log_listener = setup_logging(log_level)
+logger = logging.getLogger()
+# Meldungen pro Anfrage höchstens einmal pro Sekunde und Adresse, abgelehnte Schreibversuche alle 10 Sekunden
+request_log = LogSampler(logger, interval=1.0)
+reject_log = LogSampler(logger, interval=10.0, level=logging.WARNING)
 
-# Funktion zum Setzen von 32-Bit Float-Werten
-def set_float(context, address, value, fc=4):
-    builder = BinaryPayloadBuilder(byteorder=Endian.BIG, wordorder=Endian.BIG)
-    builder.add_32bit_float(value)
-    payload = builder.to_registers()
-    if fc == 4:  # Input Register
-        update_input_register(address, payload)
-    else:  # Holding Register (fc sollte 16 sein)
-        context[0].setValues(fc, address, payload)
-    logger.info(f"Float-Wert gesetzt: Adresse={address}, Wert={value}, Funktion Code={fc}")
+# Anfrage-Metriken, abrufbar als Prometheus-Text unter http://127.0.0.1:9502/ und im Input-Register-Diagnoseblock ab 100
+metrics = ServerMetrics()
+metrics_port = 9502
+metrics_interval = 1.0  # Sekunden zwischen zwei Aktualisierungen des Diagnoseblocks
 
-# Funktion zum Setzen von Bool-Werten
-def set_bool(context, address, bit, value, fc=4):
-    if fc == 4:  # Input Register
-        register = store.store['i'].getValues(address, 1)[0]
-    else:  # Holding Register (fc sollte 16 sein)
-        register = context[0].getValues(fc, address, 1)[0]
-    
-    old_value = bool(register & (1 << bit))
-    if value:
-        register |= (1 << bit)
-    else:
-        register &= ~(1 << bit)
-    
-    if fc == 4:  # Input Register
-        update_input_register(address, [register])
-    else:  # Holding Register
-        context[0].setValues(fc, address, [register])
-    
-    logger.info(f"Bool-Wert gesetzt: Adresse={address}, Bit={bit}, Alter Wert={old_value}, Neuer Wert={value}, Funktion Code={fc}")
+# Schreibvorgänge veröffentlichen ein neues Registerabbild, Leser sehen nie halb geschriebene Floats
+datastore_snapshots = True
+# Verzeichnis für ein dauerhaftes Registerabbild (mmap), z. B. '/var/lib/modbus-server';
+# None = nach jedem Neustart Standardwerte bis zum nächsten Schreibzugriff des Reglers
+register_image_dir = None
 
-# Initialisierung der Datenpunkte
-set_float(context, 0, 0.0, fc=4)  # Wirkleistung (Input Register)
-set_float(context, 2, 100.0, fc=4)  # Leistungsvorgabe des EVU (Input Register)
-set_float(context, 4, 0.0, fc=4)  # Windgeschwindigkeit (Input Register)
-set_bool(context, 6, 0, False, fc=4)  # Abrufmeldung (Input Register)
-set_bool(context, 6, 8, False, fc=4)  # Betriebsmeldung (Input Register)
-set_bool(context, 6, 12, False, fc=4)  # Bereitschaftsmeldung (Input Register)
-set_float(context, 8, 0.0, fc=4)  # Verfügbare Leistung (Input Register)
-set_float(context, 10, 0.0, fc=16)  # Sollwertvorgabe (Holding Register)
-set_bool(context, 12, 0, False, fc=16)  # Abrufaktivierung (Holding Register)
+# Initialisiere die Datenblöcke und den Kontext; Units, RegisterMaps und Blockgrößen kommen aus server_config
+context, units = build_server_context(SERVER_UNITS, snapshot=datastore_snapshots, image_dir=register_image_dir)
 
-# Mapping der Adressen zu den Datentypen
-address_map = {
-    0: ('float', 4),
-    2: ('float', 4),
-    4: ('float', 4),
-    6: ('bool', 4),
-    8: ('float', 4),
-    10: ('float', 16),
-    12: ('bool', 16)
-}
+# Spiegelregeln Holding -> Input Register: (Quelladresse, Anzahl, Zieladresse, Transformation)
+mirror = RegisterMirror([
+    MirrorRule(0, 2, 0, None),  # Wirkleistung vom Regler (HR 0-1) -> Input Register 0-1
+])
 
 # Callback-Funktion zum Protokollieren der geschriebenen Werte
-def on_write_data(address, values):
-    i = 0
-    while i < len(values):
-        actual_address = address + i
-        data_type, fc = address_map.get(actual_address, (None, None))
-        if data_type == 'float':
-            if i + 1 < len(values):
-                decoder = BinaryPayloadDecoder.fromRegisters(values[i:i+2], byteorder=Endian.BIG, wordorder=Endian.BIG)
-                float_value = decoder.decode_32bit_float()
-                logger.info(f"Register {actual_address} geschrieben mit Wert: {float_value} (Float)")
-                i += 2  # Float nimmt 2 Register ein
-            else:
-                logger.warning(f"Unvollständige Float-Daten bei Adresse {actual_address}")
-                i += 1
-        elif data_type == 'bool':
-            for bit in [0, 8, 12]:
-                bool_value = bool(values[i] & (1 << bit))
-                logger.info(f"Register {actual_address}.{bit} geschrieben mit Wert: {bool_value} (Boolean)")
-            i += 1
-        else:
-            logger.warning(f"Unbekannter Datentyp bei Adresse {actual_address}")
-            i += 1
+def on_write_data(unit, fc, address, values):
+    # Die typisierten Werte hat der Datenblock beim Schreiben bereits dekodiert, hier wird nur noch protokolliert
+    register_type = unit.decode(fc)  # 'h' für Holding Register (FC 6/16/23), 'c' für Coils (FC 5/15)
+    key = (register_type, unit.unit_id, address)
+    if not request_log.enabled(key):
+        return
+    # `changed` gehört zum letzten Schreibvorgang auf den Holding-Block, bei Coils also zu einem früheren
+    if register_type == 'h' and unit.holding_block.changed:
+        request_log.log(key, "Unit %s: Schreibvorgang: Funktion Code=%s, Adresse=%s, Werte=%s, Datenpunkte=%s",
+                        unit.unit_id, fc, address, values, unit.holding_block.changed)
+    else:
+        request_log.log(key, "Unit %s: Schreibvorgang: Funktion Code=%s, Adresse=%s, Werte=%s, kein Datenpunkt der REGISTER_MAP",
+                        unit.unit_id, fc, address, values)
 
 # Override der setValues-Methode, um Änderungen zu protokollieren und Schreibzugriffe auf Input Register zu verhindern
-original_set_values = store.setValues
+original_set_values = ModbusSlaveContext.setValues
 
-def logging_set_values(fc_as_hex, address, values):
+def logging_set_values(unit, fc_as_hex, address, values):
     fc = fc_as_hex
     if fc == 4:  # Input Register
-        logger.warning(f"Schreibversuch auf Input Register bei Adresse {address} abgelehnt")
+        metrics.reject('input_register')
+        if reject_log.enabled(('i', unit.unit_id, address)):
+            reject_log.log(('i', unit.unit_id, address), "Unit %s: Schreibversuch auf Input Register bei Adresse %s abgelehnt",
+                           unit.unit_id, address)
         return False
     if address >= 14:  # Erweitere den zulässigen Bereich auf 14 Adressen
-        logger.warning(f"Schreibversuch auf ungültige Adresse {address} abgelehnt")
+        metrics.reject('invalid_address')
+        if reject_log.enabled(('h', unit.unit_id, address)):
+            reject_log.log(('h', unit.unit_id, address), "Unit %s: Schreibversuch auf ungültige Adresse %s abgelehnt",
+                           unit.unit_id, address)
         return False
-    logger.info(f"Schreibvorgang gestartet: Funktion Code={fc}, Adresse={address}, Werte={values}")
-    on_write_data(address, values)
-    result = original_set_values(fc_as_hex, address, values)
+    result = original_set_values(unit, fc_as_hex, address, values)
+    on_write_data(unit, fc, address, values)
     
-    # Wenn in Holding Register 0 geschrieben wird (FC 16 oder FC 6), aktualisiere Input Register 0
-    if (fc == 16 or fc == 6) and address == 0:  # Preset Multiple Registers oder Preset Single Register
-        # Stelle sicher, dass wir beide Werte kopieren
-        update_input_register(0, values[:2])  # Kopiere die ersten zwei Register (für Float)
-        
-    logger.info(f"Schreibvorgang abgeschlossen: Ergebnis={result}")
-    return result
+    # Gespiegelte Input Register nach Preset Single/Multiple Registers (FC 6/16) in einem Schreibvorgang aktualisieren
+    if fc == 16 or fc == 6:
+        mirrored = mirror.apply(unit.holding_block, unit.input_block, address, values)
+        if mirrored and request_log.enabled(('m', unit.unit_id, address)):
+            request_log.log(('m', unit.unit_id, address), "Unit %s: Input Register gespiegelt, Datenpunkte: %s",
+                            unit.unit_id, mirrored)
 
-store.setValues = logging_set_values
+    return result
 
-# Custom Read Handler
-def custom_read_handler(register_type, address, count):
-    try:
-        if register_type == 4:  # Input Register
-            # Erhöhe die Adresse um 1 für das Input Register
-            input_address = address + 1
-            values = store.store['i'].getValues(input_address, count)
-        else:
-            values = context[0].getValues(register_type, address, count)
-        
-        # Dekodiere den Float-Wert für besseres Logging, wenn möglich
-        if count == 2:
-            decoder = BinaryPayloadDecoder.fromRegisters(values, byteorder=Endian.BIG, wordorder=Endian.BIG)
-            float_value = decoder.decode_32bit_float()
-            logger.info(f"Lesevorgang: Typ={register_type}, Adresse={address}, Anzahl={count}, Werte={values}, Float-Wert={float_value}")
-        else:
-            logger.info(f"Lesevorgang: Typ={register_type}, Adresse={address}, Anzahl={count}, Werte={values}")
-        
-        return values
-    except Exception as e:
-        logger.error(f"Fehler beim Lesen der Register: Typ={register_type}, Adresse={address}, Anzahl={count}, Fehler: {e}")
-        return [0] * count  # Rückgabe von Nullen im Fehlerfall
+# Override der getValues-Methode, um Lesevorgänge zu protokollieren (pymodbus liest über async_getValues -> getValues)
+original_get_values = ModbusSlaveContext.getValues
+READ_FUNCTION_CODES = (1, 2, 3, 4, 23)
+
+def logging_get_values(unit, fc_as_hex, address, count=1):
+    values = original_get_values(unit, fc_as_hex, address, count)
+    # Schreibanfragen lesen für ihre Antwort ebenfalls, protokolliert werden nur Leseanfragen (FC 1-4, 23)
+    if fc_as_hex in READ_FUNCTION_CODES:
+        key = ('r', unit.unit_id, fc_as_hex, address, count)
+        if request_log.enabled(key):
+            # Typisierte Werte aus dem Datenblock, passend zum Datentyp jedes gelesenen Datenpunkts
+            request_log.log(key, "Unit %s: Lesevorgang: Funktion Code=%s, Adresse=%s, Anzahl=%s, Werte=%s, Datenpunkte=%s",
+                            unit.unit_id, fc_as_hex, address, count, values, unit.points_in(fc_as_hex, address, count))
+    return values
+
+for unit in units.values():
+    mirror.validate(unit.holding_block, unit.input_block)
+    if unit.restored:
+        # Letzte bekannte Werte aus dem Registerabbild, sofort nach dem Start abrufbar
+        logger.info(f"Unit {unit.unit_id}: Registerabbild aus {register_image_dir} übernommen: {unit.input_block.typed}, {unit.holding_block.typed}")
+    else:
+        # Initialisierung der Datenpunkte mit den Startwerten der Unit
+        unit.set_points(SERVER_UNITS[unit.unit_id].defaults)
+        logger.info(f"Unit {unit.unit_id}: Startwerte gesetzt: {unit.input_block.typed}, {unit.holding_block.typed}")
 
-store.read = custom_read_handler
+    unit.setValues = functools.partial(logging_set_values, unit)
+    unit.getValues = functools.partial(logging_get_values, unit)
 
 # Modbus-Server-Identifikation
 identity = ModbusDeviceIdentification()
@@ -214,19 +129,44 @@ async def heartbeat():
 # Statusreporter-Funktion
 async def status_reporter():
     while True:
-        ir_values = custom_read_handler(4, 0, 14)
-        hr_values = custom_read_handler(3, 0, 14)
-        logger.info(f"Server-Status: Aktiv. Aktuelle Input Register Werte: {ir_values}")
-        logger.info(f"Server-Status: Aktiv. Aktuelle Holding Register Werte: {hr_values}")
+        for unit in units.values():
+            # Rohregister und typisierte Werte aus demselben Abbild
+            ir_image, ir_typed = unit.input_block.image
+            hr_image, hr_typed = unit.holding_block.image
+            ir_offset = unit.input_block.offset
+            hr_offset = unit.holding_block.offset
+            ir_values = ir_image[ir_offset:ir_offset + 14]  # Protokolladressen 0-13
+            hr_values = hr_image[hr_offset:hr_offset + 14]  # Protokolladressen 0-13
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Aktuelle Input Register Werte: {ir_values}")
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Aktuelle Holding Register Werte: {hr_values}")
+            # Typisierte Werte direkt aus den Datenblöcken, ohne erneutes Dekodieren
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Input Register Datenpunkte: {ir_typed}")
+            logger.info(f"Server-Status Unit {unit.unit_id} ({unit.name}): Holding Register Datenpunkte: {hr_typed}")
         await asyncio.sleep(300)  # Alle 5 Minuten
 
+# Diagnoseblock im Input Register aus den Metriken aktualisieren
+async def metrics_reporter():
+    while True:
+        diagnostics = metrics.diagnostics()
+        for unit in units.values():
+            # Alle Kennzahlen in einem Schreibvorgang, Leser sehen nie alte und neue Zähler gemischt;
+            # RegisterMaps ohne Diagnoseblock werden übersprungen
+            unit.input_block.set_points({name: value for name, value in diagnostics.items() if name in unit.input_block.slots})
+        await asyncio.sleep(metrics_interval)
+
 async def run_server():
     try:
-        server = await StartAsyncTcpServer(
-            context=context,
+        # Server direkt anlegen statt StartAsyncTcpServer, das erst beim Beenden zurückkehrt
+        server = ModbusTcpServer(
+            context,
             identity=identity,
-            address=("0.0.0.0", 502)
+            address=("0.0.0.0", 502),
+            request_tracer=metrics.trace_request,
+            response_manipulator=metrics.trace_response
         )
+        metrics.connections = server.active_connections
+        if not await server.listen():
+            raise OSError("Port 502 konnte nicht geöffnet werden")
         logger.info("Modbus-TCP-Server erfolgreich gestartet auf Port 502")
         
         # Überprüfe, ob der Server tatsächlich auf Port 502 hört
@@ -237,12 +177,19 @@ async def run_server():
             else:
                 logger.error(f"Server konnte nicht auf Port 502 hören. Fehlercode: {result}")
         
-        # Starte Heartbeat-Task und Status-Reporter
-        asyncio.create_task(heartbeat())
-        asyncio.create_task(status_reporter())
+        # Starte Heartbeat-Task, Status-Reporter und Metriken
+        tasks = [
+            asyncio.create_task(heartbeat()),
+            asyncio.create_task(status_reporter()),
+            asyncio.create_task(metrics_reporter()),
+            asyncio.create_task(serve_metrics(metrics, port=metrics_port)),
+        ]
         
-        while True:
-            await asyncio.sleep(1)
+        try:
+            await server.serving
+        finally:
+            for task in tasks:
+                task.cancel()
     except Exception as e:
         logger.error(f"Fehler beim Starten oder Ausführen des Servers: {e}")
         raise
@@ -254,7 +201,14 @@ async def main():
     except Exception as e:
         logger.error(f"Kritischer Fehler beim Starten des Servers: {e}")
     finally:
-        logger.info("Server wird beendet.")
+        shutdown()
+
+def shutdown():
+    """Registerabbilder sichern und die restlichen Logmeldungen ausgeben."""
+    logger.info("Server wird beendet.")
+    for unit in units.values():
+        unit.flush()
+    log_listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
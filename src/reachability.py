@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+
+class ReachabilityCache:
+    """Erreichbarkeit der Wechselrichter per nicht-blockierendem TCP-Connect, zwischengespeichert mit TTL."""
+
+    def __init__(self, port, ttl=30.0, timeout=1.0):
+        self.port = port
+        self.ttl = ttl
+        self.timeout = timeout
+        self.entries = {}  # host -> (reachable, timestamp)
+
+    async def probe(self, host):
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def probe_all(self, hosts):
+        hosts = list(hosts)
+        results = await asyncio.gather(*(self.probe(host) for host in hosts))
+        now = time.monotonic()
+        for host, reachable in zip(hosts, results):
+            self.entries[host] = (reachable, now)
+        return dict(zip(hosts, results))
+
+    async def refresh(self, hosts):
+        """Prüft nur die Hosts, deren Eintrag fehlt oder abgelaufen ist."""
+        now = time.monotonic()
+        stale = [host for host in hosts if host not in self.entries or now - self.entries[host][1] >= self.ttl]
+        if stale:
+            await self.probe_all(stale)
+
+    def is_reachable(self, host):
+        # Unbekannte Hosts gelten als erreichbar, die eigentliche Anfrage entscheidet dann
+        entry = self.entries.get(host)
+        return entry is None or entry[0]
+
+    def mark(self, host, reachable):
+        self.entries[host] = (reachable, time.monotonic())
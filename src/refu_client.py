@@ -0,0 +1,178 @@
+import asyncio
+from collections import namedtuple
+
+REFU_PORT = 21063
+REFU_PARAM_ACTIVE_POWER = 1106
+REFU_PARAM_POWER_LIMIT = 1162
+
+
+def to_int(reply):
+    return int(float(reply))
+
+
+class RefuParameterSet:
+    """Satz von Parametern, die pro Wechselrichter gemeinsam gelesen und als ein Record geliefert werden."""
+
+    def __init__(self, name, parameters):
+        # parameters: Liste von (Feldname, Parameter-ID, Konverter)
+        self.parameters = list(parameters)
+        self.record_type = namedtuple(name, ['host'] + [field for field, _, _ in self.parameters])
+
+    @property
+    def commands(self):
+        return [f'REFU.GetParameter {parameter}' for _, parameter, _ in self.parameters]
+
+    def parse(self, host, replies):
+        values = []
+        for (_, _, convert), reply in zip(self.parameters, replies):
+            try:
+                values.append(convert(reply))
+            except ValueError:
+                values.append(None)
+        return self.record_type(host, *values)
+
+
+REFU_TELEMETRY = RefuParameterSet('RefuTelemetry', [
+    ('active_power', REFU_PARAM_ACTIVE_POWER, to_int),
+])
+
+
+def nameplate_parameter_set(parameter):
+    """Parametersatz für die Nennleistung; die Parameter-ID kommt aus der Konfiguration des Aufrufers."""
+    return RefuParameterSet('RefuNameplate', [
+        ('peak_power', parameter, to_int),
+    ])
+
+
+class RefuConnection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def is_open(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def open(self, timeout):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    async def request(self, commands, timeout, reply_optional=False):
+        # Alle Kommandos in einem Schreibvorgang senden, dann eine Antwortzeile pro Kommando lesen
+        self.writer.write(b''.join(command.encode() + b'\n' for command in commands))
+        await self.writer.drain()
+        replies = []
+        for _ in commands:
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), timeout)
+            except asyncio.TimeoutError:
+                if not reply_optional:
+                    raise
+                # Keine Antwort ist zulässig; eine verspätete Antwort würde aber der nächsten Anfrage zugeordnet,
+                # daher wird die Verbindung verworfen und beim nächsten Kommando neu aufgebaut
+                self.abort()
+                return replies + [None] * (len(commands) - len(replies))
+            if not line:
+                raise ConnectionResetError(f"Connection to {self.host} closed by inverter")
+            replies.append(line.decode('utf-8').strip())
+        return replies
+
+
+class RefuClient:
+    """Asyncio-Client für das REFU-Textprotokoll mit einer dauerhaften Verbindung pro Wechselrichter."""
+
+    def __init__(self, port=REFU_PORT, connect_timeout=2.0, reply_timeout=2.0, set_reply_timeout=0.5):
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.reply_timeout = reply_timeout
+        self.set_reply_timeout = set_reply_timeout
+        self.connections = {}
+
+    def _connection(self, host):
+        connection = self.connections.get(host)
+        if connection is None:
+            connection = RefuConnection(host, self.port)
+            self.connections[host] = connection
+        return connection
+
+    async def send(self, host, command):
+        replies = await self.send_batch(host, [command])
+        return replies[0]
+
+    async def send_batch(self, host, commands, reply_timeout=None, reply_optional=False):
+        connection = self._connection(host)
+        if reply_timeout is None:
+            reply_timeout = self.reply_timeout
+        async with connection.lock:
+            # Eine vom Wechselrichter geschlossene Verbindung wird einmal neu aufgebaut
+            for attempt in range(2):
+                try:
+                    if not connection.is_open:
+                        await connection.open(self.connect_timeout)
+                    return await connection.request(commands, reply_timeout, reply_optional)
+                except asyncio.CancelledError:
+                    # Abgebrochene Anfrage: offene Antworten würden die nächste Anfrage verfälschen
+                    connection.abort()
+                    raise
+                except (OSError, asyncio.TimeoutError):
+                    await connection.close()
+                    if attempt == 1:
+                        raise
+
+    async def get_parameter(self, host, parameter):
+        return await self.send(host, f'REFU.GetParameter {parameter}')
+
+    async def read(self, host, parameter_set=REFU_TELEMETRY):
+        replies = await self.send_batch(host, parameter_set.commands)
+        return parameter_set.parse(host, replies)
+
+    async def set_parameter(self, host, parameter, index, value):
+        """Schreibt einen Parameter. Liefert die Antwortzeile oder None, wenn der Wechselrichter nicht antwortet."""
+        # SetParameter wird nicht verlässlich beantwortet; ohne Antwort innerhalb von set_reply_timeout gilt es als gesendet
+        replies = await self.send_batch(host, [f'REFU.SetParameter {parameter},{index},{value}'],
+                                        self.set_reply_timeout, reply_optional=True)
+        return replies[0]
+
+    async def get_current_power(self, host):
+        reply = await self.get_parameter(host, REFU_PARAM_ACTIVE_POWER)
+        return int(float(reply))
+
+    async def set_power_limit(self, host, regulation_factor):
+        """Schreibt die Leistungsbegrenzung und liest sie mit einer eigenen Anfrage zurück.
+
+        Liefert True, wenn der Wechselrichter den geschriebenen Wert zurückmeldet, sonst False.
+        """
+        value = regulation_factor * 1000
+        await self.set_parameter(host, REFU_PARAM_POWER_LIMIT, 0, value)
+        reply = await self.get_parameter(host, REFU_PARAM_POWER_LIMIT)
+        try:
+            # Der Wechselrichter speichert ganzzahlig, daher eine Einheit Toleranz
+            return abs(float(reply) - value) <= 1
+        except ValueError:
+            return False
+
+    async def close(self, host=None):
+        hosts = [host] if host is not None else list(self.connections)
+        for key in hosts:
+            connection = self.connections.pop(key, None)
+            if connection is not None:
+                await connection.close()
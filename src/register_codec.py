@@ -0,0 +1,122 @@
+import functools
+import struct
+
+WORD_ORDER_BIG = 'big'  # höherwertiges Wort zuerst (wie BinaryPayloadBuilder mit wordorder=Endian.BIG)
+WORD_ORDER_LITTLE = 'little'
+
+_WORD = struct.Struct('>H')
+_WORDS = struct.Struct('>HH')
+
+
+class ScalarCodec:
+    """Vorkompilierter Encoder/Decoder für einen Datentyp über 1 oder 2 Register (Byte-Reihenfolge Big-Endian)."""
+
+    def __init__(self, fmt, word_order=WORD_ORDER_BIG):
+        self.value = struct.Struct('>' + fmt)
+        self.count = self.value.size // 2
+        self.swap = word_order == WORD_ORDER_LITTLE and self.count == 2
+
+    def encode(self, value):
+        if self.count == 1:
+            return [_WORD.unpack(self.value.pack(value))[0]]
+        high, low = _WORDS.unpack(self.value.pack(value))
+        return [low, high] if self.swap else [high, low]
+
+    def decode(self, registers):
+        if self.count == 1:
+            return self.value.unpack(_WORD.pack(registers[0]))[0]
+        if self.swap:
+            return self.value.unpack(_WORDS.pack(registers[1], registers[0]))[0]
+        return self.value.unpack(_WORDS.pack(registers[0], registers[1]))[0]
+
+
+class BitfieldCodec:
+    """Einzelne Bits eines 16-Bit-Registers, z. B. Abruf-, Betriebs- und Bereitschaftsmeldung in Register 6."""
+
+    count = 1
+
+    def __init__(self, bits):
+        self.masks = {bit: 1 << bit for bit in bits}
+
+    def encode(self, flags, register=0):
+        for bit, value in flags.items():
+            mask = self.masks[bit]
+            register = register | mask if value else register & ~mask
+        return [register & 0xFFFF]
+
+    def decode(self, registers):
+        register = registers[0]
+        return {bit: bool(register & mask) for bit, mask in self.masks.items()}
+
+
+_FORMATS = {'float32': 'f', 'int32': 'i', 'uint32': 'I', 'int16': 'h', 'uint16': 'H'}
+_CODECS = {}
+
+
+def get_codec(data_type, word_order=WORD_ORDER_BIG):
+    """Liefert den (zwischengespeicherten) Codec für `data_type`."""
+    key = (data_type, word_order)
+    codec = _CODECS.get(key)
+    if codec is None:
+        codec = ScalarCodec(_FORMATS[data_type], word_order)
+        _CODECS[key] = codec
+    return codec
+
+
+FLOAT32 = get_codec('float32')
+INT32 = get_codec('int32')
+UINT16 = get_codec('uint16')
+
+
+@functools.lru_cache(maxsize=256)
+def _word_struct(count):
+    return struct.Struct(f'>{count}H')
+
+
+class BlockCodec:
+    """Ganzer Registerblock <-> Liste typisierter Werte mit je einem struct-Aufruf.
+
+    `data_types` beschreibt den Block lückenlos von vorne, z. B. ['float32', 'float32', 'uint16', 'uint16'].
+    """
+
+    def __init__(self, data_types, word_order=WORD_ORDER_BIG):
+        self.data_types = list(data_types)
+        self.values = struct.Struct('>' + ''.join(_FORMATS[data_type] for data_type in self.data_types))
+        self.count = self.values.size // 2
+        self.words = _word_struct(self.count)
+        # Bei Little-Word-Order werden die Worte jedes 32-Bit-Werts vertauscht
+        self.order = None
+        if word_order == WORD_ORDER_LITTLE:
+            self.order = []
+            for data_type in self.data_types:
+                offset = len(self.order)
+                self.order.extend([offset + 1, offset] if struct.calcsize(_FORMATS[data_type]) == 4 else [offset])
+
+    def decode(self, registers):
+        if self.order is not None:
+            registers = [registers[i] for i in self.order]
+        return list(self.values.unpack(self.words.pack(*registers[:self.count])))
+
+    def encode(self, values):
+        registers = self.words.unpack(self.values.pack(*values))
+        if self.order is not None:
+            return [registers[i] for i in self.order]
+        return list(registers)
+
+
+def decode_array(data_type, registers, word_order=WORD_ORDER_BIG):
+    """Dekodiert einen Block gleichartiger Werte (z. B. nur float32) mit struct.iter_unpack."""
+    codec = get_codec(data_type, word_order)
+    if codec.swap:
+        registers = [registers[i ^ 1] for i in range(len(registers))]
+    raw = _word_struct(len(registers)).pack(*registers)
+    return [value for (value,) in struct.iter_unpack(codec.value.format, raw)]
+
+
+def encode_array(data_type, values, word_order=WORD_ORDER_BIG):
+    codec = get_codec(data_type, word_order)
+    raw = struct.pack('>' + _FORMATS[data_type] * len(values), *values)
+    registers = list(_word_struct(len(raw) // 2).unpack(raw))
+    if codec.swap:
+        registers = [registers[i ^ 1] for i in range(len(registers))]
+    return registers
@@ -0,0 +1,260 @@
+import os
+import threading
+from collections import namedtuple
+
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+
+from register_codec import BlockCodec, get_codec
+from register_image import MappedRegisterImage, layout_checksum
+from register_map import REGISTER_COUNTS
+
+# Vorberechneter Zugriff auf einen Datenpunkt: Startadresse im Block, Registeranzahl, Decoder
+Slot = namedtuple('Slot', ['name', 'start', 'count', 'decode'])
+
+
+def _bit_decoder(mask):
+    return lambda registers: bool(registers[0] & mask)
+
+
+class RegisterMapDataBlock(ModbusSequentialDataBlock):
+    """Datenblock für einen Registertyp, erzeugt aus einer RegisterMap.
+
+    Decoder und Bitmasken werden beim Anlegen einmal pro Adresse vorberechnet. Neben den Rohregistern hält der Block
+    die dekodierten Werte (`typed`); ein Schreibzugriff dekodiert nur die Datenpunkte an den geschriebenen Adressen.
+    Ohne `zero_mode` addiert der ModbusSlaveContext 1 zur Protokolladresse, die Datenpunkte liegen dann entsprechend
+    eine Adresse höher im Block.
+
+    Mit `snapshot=True` schreibt jeder Schreibvorgang in eine Kopie des Registerabbilds und veröffentlicht sie danach
+    durch Austausch einer Referenz. Leser sehen so immer ein vollständiges Abbild (nie einen halb geschriebenen Float)
+    und brauchen keine Sperre; `image` liefert Rohregister und typisierte Werte desselben Stands.
+
+    Mit `backing` (MappedRegisterImage) wird jeder Schreibvorgang zusätzlich in die eingeblendete Datei übernommen;
+    enthält sie beim Start ein passendes Abbild, beginnt der Block mit diesen Werten (`restored`).
+
+    Funktionen in `listeners` werden nach jedem Schreibvorgang mit den geänderten Datenpunkten ({Name: Wert})
+    aufgerufen, im Thread des Schreibers und nach Freigabe der Sperre.
+    """
+
+    def __init__(self, register_map, function_code, size, zero_mode=False, snapshot=False, backing=None):
+        self.backing = backing
+        self.restored = backing is not None and backing.restored
+        super().__init__(0, backing.load() if self.restored else [0] * size)
+        self.register_map = register_map
+        self.offset = 0 if zero_mode else 1
+        self.snapshot = snapshot
+        self.write_lock = threading.Lock()  # nur zwischen Schreibern
+        self.slots = {}
+        self.by_address = {}  # Blockadresse -> Slots, die dieses Register belegen
+        for point in register_map.points:
+            if point.function_code != function_code:
+                continue
+            if point.data_type == 'bool':
+                decode = _bit_decoder(1 << point.bit)
+            else:
+                decode = get_codec(point.data_type).decode
+            slot = Slot(point.name, point.address + self.offset, REGISTER_COUNTS[point.data_type], decode)
+            self.slots[point.name] = slot
+            for address in range(slot.start, slot.start + slot.count):
+                self.by_address.setdefault(address, []).append(slot)
+        self._publish(self.values, {name: self._decode(self.values, slot) for name, slot in self.slots.items()})
+        self.changed = {}  # Datenpunkte, die der letzte setValues-Aufruf verändert hat
+        self.decoders = {}  # frozenset(Namen) -> Decoder für Schreibvorgänge über mehrere Datenpunkte
+        self.listeners = []
+
+    def _decode(self, values, slot):
+        start = slot.start - self.address
+        return slot.decode(values[start:start + slot.count])
+
+    def _block_decoder(self, slots):
+        """Dekodiert mehrere Datenpunkte mit einem BlockCodec über ihren Adressbereich (Lücken als uint16)."""
+        slots = sorted(slots, key=lambda slot: slot.start)
+        layout = []
+        fields = []  # je Codec-Feld: [(Name, Bitmaske oder None)]
+        address = slots[0].start
+        for slot in slots:
+            point = self.register_map[slot.name]
+            mask = 1 << point.bit if point.data_type == 'bool' else None
+            if slot.start < address:
+                # Weiteres Bit im selben Register
+                fields[-1].append((slot.name, mask))
+                continue
+            while address < slot.start:
+                layout.append('uint16')
+                fields.append([])
+                address += 1
+            layout.append('uint16' if mask is not None else point.data_type)
+            fields.append([(slot.name, mask)])
+            address += slot.count
+        codec = BlockCodec(layout)
+        first = slots[0].start - self.address
+
+        def decode(values):
+            decoded = {}
+            for raw, field in zip(codec.decode(values[first:first + codec.count]), fields):
+                for name, mask in field:
+                    decoded[name] = raw if mask is None else bool(raw & mask)
+            return decoded
+
+        return decode
+
+    def _publish(self, values, typed):
+        # `image` wird mit einer einzigen Zuweisung ersetzt, Leser erhalten entweder den alten oder den neuen Stand
+        self.image = (values, typed)
+        self.values = values
+        self.typed = typed
+
+    def setValues(self, address, values):
+        self.set_many([(address, values if isinstance(values, list) else [values])])
+
+    def set_many(self, writes):
+        """Schreibt mehrere (Blockadresse, Werte)-Bereiche in einem Vorgang; jeder betroffene Datenpunkt wird einmal dekodiert."""
+        with self.write_lock:
+            changed = self._write(writes)
+        self._notify(changed)
+
+    def modify(self, address, count, update):
+        """Ersetzt `count` Register durch `update(alte Werte)`, ohne dass ein anderer Schreiber dazwischenkommt.
+
+        Liefert die alten Werte.
+        """
+        with self.write_lock:
+            start = address - self.address
+            previous = self.values[start:start + count]
+            changed = self._write([(address, update(previous))])
+        self._notify(changed)
+        return previous
+
+    def _notify(self, changed):
+        if changed:
+            for listener in self.listeners:
+                listener(changed)
+
+    def _write(self, writes):
+        for address, registers in writes:
+            # Vor dem ersten Schreiben prüfen: eine Slice-Zuweisung würde den Block sonst stillschweigend verlängern
+            if not self.validate(address, len(registers)):
+                raise ValueError(f"Register {address}-{address + len(registers) - 1} außerhalb des Datenblocks")
+        values, typed = self.image
+        if self.snapshot:
+            values, typed = list(values), dict(typed)
+        slots = {}
+        for address, registers in writes:
+            start = address - self.address
+            values[start:start + len(registers)] = registers
+            for register in range(address, address + len(registers)):
+                for slot in self.by_address.get(register, ()):
+                    slots[slot.name] = slot
+        if len(slots) == 1:
+            slot, = slots.values()
+            changed = {slot.name: self._decode(values, slot)}
+        elif slots:
+            key = frozenset(slots)
+            decoder = self.decoders.get(key)
+            if decoder is None:
+                decoder = self.decoders[key] = self._block_decoder(slots.values())
+            changed = decoder(values)
+        else:
+            changed = {}
+        typed.update(changed)
+        self._publish(values, typed)
+        self.changed = changed
+        if self.backing is not None:
+            for address, registers in writes:
+                self.backing.write(address - self.address, registers)
+        return changed
+
+    def get_point(self, name):
+        return self.typed[name]
+
+    def points_in(self, address, count):
+        """Typisierte Werte aller Datenpunkte, die `count` Register ab Blockadresse `address` belegen, ohne Dekodieren."""
+        typed = self.image[1]
+        points = {}
+        for register in range(address, address + count):
+            for slot in self.by_address.get(register, ()):
+                points[slot.name] = typed[slot.name]
+        return points
+
+    def set_point(self, name, value):
+        """Schreibt einen typisierten Wert über den Codec des Datenpunkts in die Rohregister."""
+        self.set_points({name: value})
+
+    def set_points(self, points):
+        """Schreibt mehrere typisierte Werte ({Name: Wert}) in einem Vorgang; Leser sehen alle neuen Werte oder keinen."""
+        with self.write_lock:
+            changed = self._write(self._encode(points))
+        self._notify(changed)
+
+    def _encode(self, points):
+        # Nur unter write_lock aufrufen: Bool-Punkte ändern ihr Bit im aktuellen Registerwert
+        writes = []
+        bits = {}  # Blockadresse -> Registerwert, mehrere Bits desselben Registers werden zusammengefasst
+        for name, value in points.items():
+            point = self.register_map[name]
+            slot = self.slots[name]
+            if point.data_type == 'bool':
+                mask = 1 << point.bit
+                register = bits.get(slot.start, self.values[slot.start - self.address])
+                bits[slot.start] = register | mask if value else register & ~mask
+            else:
+                writes.append((slot.start, get_codec(point.data_type).encode(value)))
+        writes.extend((address, [register]) for address, register in bits.items())
+        return writes
+
+
+class RegisterMapSlaveContext(ModbusSlaveContext):
+    """Registersatz einer Unit: Input- und Holding-Register als RegisterMapDataBlocks derselben RegisterMap."""
+
+    def __init__(self, register_map, input_size, holding_size, unit_id=None, name=None, snapshot=False, image_dir=None):
+        input_backing = holding_backing = None
+        if image_dir is not None:
+            input_backing = MappedRegisterImage(os.path.join(image_dir, f'unit{unit_id}_input.img'), input_size,
+                                                layout_checksum(register_map, 4))
+            holding_backing = MappedRegisterImage(os.path.join(image_dir, f'unit{unit_id}_holding.img'), holding_size,
+                                                  layout_checksum(register_map, 3))
+        self.input_block = RegisterMapDataBlock(register_map, 4, input_size, snapshot=snapshot, backing=input_backing)
+        self.holding_block = RegisterMapDataBlock(register_map, 3, holding_size, snapshot=snapshot, backing=holding_backing)
+        super().__init__(ir=self.input_block, hr=self.holding_block)
+        self.unit_id = unit_id
+        self.name = name
+
+    @property
+    def restored(self):
+        """True, wenn beide Registertypen aus dem dauerhaften Abbild übernommen wurden."""
+        return self.input_block.restored and self.holding_block.restored
+
+    def set_points(self, points):
+        """Schreibt typisierte Werte ({Name: Wert}) jeweils in den Block, zu dem der Datenpunkt gehört."""
+        for block in (self.input_block, self.holding_block):
+            values = {name: value for name, value in points.items() if name in block.slots}
+            if values:
+                block.set_points(values)
+
+    def points_in(self, fc_as_hex, address, count):
+        """Typisierte Werte der Datenpunkte im Bereich einer Anfrage (Protokolladressen); {} für Coils und Discrete Inputs."""
+        block = self.store[self.decode(fc_as_hex)]
+        if not isinstance(block, RegisterMapDataBlock):
+            return {}
+        return block.points_in(address + block.offset, count)
+
+    def flush(self):
+        for block in (self.input_block, self.holding_block):
+            if block.backing is not None:
+                block.backing.flush()
+
+
+def build_server_context(units, snapshot=False, image_dir=None):
+    """Legt für {unit_id: UnitConfig} je einen eigenen Registersatz an und liefert (ModbusServerContext, {unit_id: Registersatz}).
+
+    RegisterMap und Blockgrößen kommen pro Unit aus der UnitConfig (server_config).
+
+    pymodbus findet die Unit einer Anfrage per Dict-Lookup, die Kosten hängen nicht von der Anzahl der Units ab.
+    Ist nur eine Unit konfiguriert, beantwortet sie wie bisher Anfragen an jede Unit-ID.
+    Mit `image_dir` bekommt jede Unit ein dauerhaftes, per mmap eingeblendetes Registerabbild in diesem Verzeichnis.
+    """
+    units = {unit_id: RegisterMapSlaveContext(config.register_map, config.input_size, config.holding_size, unit_id,
+                                              config.name, snapshot, image_dir)
+             for unit_id, config in units.items()}
+    if len(units) == 1:
+        return ModbusServerContext(slaves=next(iter(units.values())), single=True), units
+    return ModbusServerContext(slaves=units, single=False), units
@@ -0,0 +1,58 @@
+import mmap
+import os
+import struct
+import zlib
+from array import array
+
+# Kopf: Kennung, Anzahl Register, Prüfsumme des Registerlayouts; danach ein uint16 pro Register (native Byte-Reihenfolge)
+_HEADER = struct.Struct('<4sII')
+_MAGIC = b'MREG'
+
+
+def layout_checksum(register_map, function_code):
+    """Prüfsumme über die Datenpunkte eines Registertyps; ändert sich das Layout, wird ein altes Abbild verworfen."""
+    points = [point for point in register_map.points if point.function_code == function_code]
+    return zlib.crc32(repr(points).encode())
+
+
+class MappedRegisterImage:
+    """Registerabbild in einer per mmap eingeblendeten Datei.
+
+    Schreibzugriffe landen direkt im Mapping; nach einem Neustart wird die Datei wieder eingeblendet und die Register
+    stehen ohne Einlesen oder Deserialisieren zur Verfügung. Passen Größe oder Layout nicht, beginnt das Abbild leer
+    (`restored` ist dann False).
+    """
+
+    def __init__(self, path, size, layout=0):
+        self.path = path
+        self.size = size
+        length = _HEADER.size + 2 * size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing != length:
+                os.ftruncate(fd, length)
+            self.mmap = mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
+        self.restored = existing == length and _HEADER.unpack_from(self.mmap) == (_MAGIC, size, layout)
+        if not self.restored:
+            self.mmap[:] = bytes(length)
+            _HEADER.pack_into(self.mmap, 0, _MAGIC, size, layout)
+        self.registers = memoryview(self.mmap)[_HEADER.size:].cast('H')
+
+    def load(self):
+        return self.registers.tolist()
+
+    def write(self, address, values):
+        self.registers[address:address + len(values)] = array('H', values)
+
+    def flush(self):
+        self.mmap.flush()
+
+    def close(self):
+        self.registers.release()
+        self.mmap.close()
@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+from register_codec import get_codec
+
+# function_code: 4 = Input Register, 3 = Holding Register; bit nur für 'bool'
+Point = namedtuple('Point', ['name', 'address', 'data_type', 'function_code', 'bit'])
+ReadBlock = namedtuple('ReadBlock', ['function_code', 'address', 'count', 'points'])
+
+REGISTER_COUNTS = {'float32': 2, 'int32': 2, 'uint32': 2, 'uint16': 1, 'bool': 1}
+MAX_READ_COUNT = 125  # Modbus-Grenze für read_holding_registers / read_input_registers
+
+
+class RegisterMap:
+    """Deklarative Datenpunkt-Tabelle, gemeinsam genutzt von Poller (Client) und Modbus-Server."""
+
+    def __init__(self, points):
+        self.points = list(points)
+        self.by_name = {point.name: point for point in self.points}
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    @property
+    def size(self):
+        return max(point.address + REGISTER_COUNTS[point.data_type] for point in self.points)
+
+    def plan_reads(self, names=None, max_gap=4):
+        """Fasst die angefragten Punkte zu möglichst wenigen Lesebefehlen zusammen.
+
+        Punkte mit gleichem Function Code werden zusammengelegt, solange die Lücke zwischen ihnen höchstens
+        `max_gap` Register beträgt und der Block nicht größer als MAX_READ_COUNT wird.
+        """
+        points = self.points if names is None else [self.by_name[name] for name in names]
+        blocks = []
+        for function_code in sorted({point.function_code for point in points}):
+            current = None
+            for point in sorted((p for p in points if p.function_code == function_code), key=lambda p: p.address):
+                end = point.address + REGISTER_COUNTS[point.data_type]
+                if current is not None and point.address - (current.address + current.count) <= max_gap \
+                        and end - current.address <= MAX_READ_COUNT:
+                    current = current._replace(count=max(current.count, end - current.address),
+                                               points=current.points + (point,))
+                    blocks[-1] = current
+                else:
+                    current = ReadBlock(function_code, point.address, end - point.address, (point,))
+                    blocks.append(current)
+        return blocks
+
+    @staticmethod
+    def decode_point(point, registers):
+        if point.data_type == 'bool':
+            return bool(registers[0] & (1 << point.bit))
+        return get_codec(point.data_type).decode(registers)
+
+    def decode_block(self, block, registers):
+        values = {}
+        for point in block.points:
+            offset = point.address - block.address
+            values[point.name] = self.decode_point(point, registers[offset:offset + REGISTER_COUNTS[point.data_type]])
+        return values
+
+
+# Datenpunkte des Direktvermarkter-Servers (pymodbus_server_v5)
+REGISTER_MAP = RegisterMap([
+    Point('active_power', 0, 'float32', 4, None),  # Wirkleistung
+    Point('grid_operator_limit', 2, 'float32', 4, None),  # Leistungsvorgabe des EVU
+    Point('wind_speed', 4, 'float32', 4, None),  # Windgeschwindigkeit
+    Point('call_signal', 6, 'bool', 4, 0),  # Abrufmeldung
+    Point('operating_signal', 6, 'bool', 4, 8),  # Betriebsmeldung
+    Point('ready_signal', 6, 'bool', 4, 12),  # Bereitschaftsmeldung
+    Point('available_power', 8, 'float32', 4, None),  # Verfügbare Leistung
+    Point('set_point', 10, 'float32', 3, None),  # Sollwertvorgabe
+    Point('polling_activation', 12, 'bool', 3, 0),  # Abrufaktivierung
+    # Reservierter Diagnoseblock, vom Server aus ServerMetrics befüllt
+    Point('diag_requests', 100, 'uint32', 4, None),  # Anfragen gesamt
+    Point('diag_errors', 102, 'uint32', 4, None),  # Exception-Antworten
+    Point('diag_rejected_writes', 104, 'uint32', 4, None),  # Abgelehnte Schreibzugriffe
+    Point('diag_active_connections', 106, 'uint16', 4, None),  # Aktive Verbindungen
+    Point('diag_latency_mean_us', 107, 'uint32', 4, None),  # Mittlere Antwortzeit in Mikrosekunden
+    Point('diag_uptime', 109, 'uint32', 4, None),  # Laufzeit in Sekunden
+])
@@ -0,0 +1,56 @@
+from collections import namedtuple
+
+# Quelle: Holding Register `source` bis `source + count - 1`; Ziel: Input Register ab `destination`.
+# `transform` bildet optional die Quellregister auf die Zielregister ab (gleiche Anzahl), sonst 1:1-Kopie.
+MirrorRule = namedtuple('MirrorRule', ['source', 'count', 'destination', 'transform'])
+
+
+class RegisterMirror:
+    """Spiegelt Schreibzugriffe auf Holding Register nach einer Regeltabelle in Input Register.
+
+    Alle Regeln, deren Quelle ein Schreibzugriff berührt, werden in einem einzigen set_many auf den Ziel-Datenblock
+    angewendet; die Zielwerte werden nicht zurückgelesen. Adressen sind Protokolladressen (ohne Block-Offset).
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.by_address = {}  # Quelladresse -> Regeln, die dieses Register lesen
+        for rule in self.rules:
+            for address in range(rule.source, rule.source + rule.count):
+                self.by_address.setdefault(address, []).append(rule)
+
+    def validate(self, source_block, destination_block):
+        """Prüft, dass Quelle und Ziel jeder Regel vollständig in den Datenblöcken liegen; sonst ValueError."""
+        for rule in self.rules:
+            for block, start, kind in ((source_block, rule.source, 'Quelle'), (destination_block, rule.destination, 'Ziel')):
+                if start < 0 or not block.validate(start + block.offset, rule.count):
+                    raise ValueError(f"{kind} von {rule} liegt außerhalb des Datenblocks")
+
+    def rules_for(self, address, count):
+        rules = []
+        for register in range(address, address + count):
+            for rule in self.by_address.get(register, ()):
+                if rule not in rules:
+                    rules.append(rule)
+        return rules
+
+    def apply(self, source_block, destination_block, address, values):
+        """Aktualisiert `destination_block` nach einem Schreibzugriff auf `source_block` und liefert die geänderten Datenpunkte."""
+        rules = self.rules_for(address, len(values))
+        if not rules:
+            return {}
+        writes = []
+        for rule in rules:
+            offset = rule.source - address
+            if offset >= 0 and offset + rule.count <= len(values):
+                registers = values[offset:offset + rule.count]
+            else:
+                # Schreibzugriff deckt die Quelle nur teilweise ab: restliche Register aus dem Quellblock
+                registers = source_block.getValues(rule.source + source_block.offset, rule.count)
+            if rule.transform is not None:
+                registers = rule.transform(registers)
+                if len(registers) != rule.count:
+                    raise ValueError(f"Transformation von {rule} liefert {len(registers)} statt {rule.count} Register")
+            writes.append((rule.destination + destination_block.offset, list(registers)))
+        destination_block.set_many(writes)
+        return destination_block.changed
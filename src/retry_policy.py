@@ -0,0 +1,143 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Öffnet nach `failure_threshold` Fehlern in Folge; nach `reset_timeout` Sekunden ist ein einzelner Probeversuch erlaubt.
+
+    Bleibt das Ergebnis eines Probeversuchs aus, ist nach weiteren `reset_timeout` Sekunden ein neuer erlaubt.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout \
+                    or self.state == self.HALF_OPEN and now - self.probe_started >= self.reset_timeout:
+                # Genau ein Probeversuch, bis dessen Ergebnis feststeht
+                self.state = self.HALF_OPEN
+                self.probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_abort(self):
+        """Versuch ohne verwertbares Ergebnis (andere Exception, Abbruch); ein laufender Probeversuch gilt als gescheitert."""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.state != self.CLOSED
+
+
+class CircuitBreakerRegistry:
+    """Ein CircuitBreaker pro Gerät, bei Bedarf angelegt."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, device_id):
+        with self.lock:
+            breaker = self.breakers.get(device_id)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self.breakers[device_id] = breaker
+            return breaker
+
+
+class RetryPolicy:
+    """Begrenzte Wiederholung mit exponentiellem Backoff und Jitter, optional mit CircuitBreaker pro Gerät."""
+
+    def __init__(self, attempts=3, base_delay=0.1, max_delay=2.0, retry_on=(Exception,)):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def delay(self, attempt):
+        # "Full Jitter": zufällige Wartezeit zwischen 0 und der exponentiellen Obergrenze
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _should_retry(self, attempt, breaker):
+        return attempt + 1 < self.attempts and (breaker is None or not breaker.is_open)
+
+    def call(self, fn, *args, breaker=None, **kwargs):
+        for attempt in range(self.attempts):
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError("Circuit breaker open")
+            try:
+                result = fn(*args, **kwargs)
+            except self.retry_on:
+                if breaker is not None:
+                    breaker.record_failure()
+                if not self._should_retry(attempt, breaker):
+                    raise
+                time.sleep(self.delay(attempt))
+            except BaseException:
+                # z. B. KeyError aus der Antwort oder CancelledError an der Poll-Deadline
+                if breaker is not None:
+                    breaker.record_abort()
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+
+    async def call_async(self, fn, *args, breaker=None, **kwargs):
+        for attempt in range(self.attempts):
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError("Circuit breaker open")
+            try:
+                result = await fn(*args, **kwargs)
+            except self.retry_on:
+                if breaker is not None:
+                    breaker.record_failure()
+                if not self._should_retry(attempt, breaker):
+                    raise
+                await asyncio.sleep(self.delay(attempt))
+            except BaseException:
+                # z. B. KeyError aus der Antwort oder CancelledError an der Poll-Deadline
+                if breaker is not None:
+                    breaker.record_abort()
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
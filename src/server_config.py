@@ -0,0 +1,25 @@
+from collections import namedtuple
+
+from register_map import REGISTER_MAP
+
+# Registersatz einer Unit: Anlage, RegisterMap, Startwerte {Datenpunkt: Wert}, Größe der Input- und Holding-Register
+UnitConfig = namedtuple('UnitConfig', ['name', 'register_map', 'defaults', 'input_size', 'holding_size'])
+
+# Startwerte der Direktvermarkter-Datenpunkte
+DIREKTVERMARKTER_DEFAULTS = {
+    'active_power': 0.0,  # Wirkleistung
+    'grid_operator_limit': 100.0,  # Leistungsvorgabe des EVU
+    'wind_speed': 0.0,  # Windgeschwindigkeit
+    'call_signal': False,  # Abrufmeldung
+    'operating_signal': False,  # Betriebsmeldung
+    'ready_signal': False,  # Bereitschaftsmeldung
+    'available_power': 0.0,  # Verfügbare Leistung
+    'set_point': 0.0,  # Sollwertvorgabe
+    'polling_activation': False,  # Abrufaktivierung
+}
+
+# Units der Modbus-Server (Unit-ID -> UnitConfig), gemeinsam für pymodbus_server_v2, v4 und v5
+SERVER_UNITS = {
+    # Input Register inkl. Diagnoseblock (100-110), Holding Register (0-19)
+    5: UnitConfig('Direktvermarkter', REGISTER_MAP, DIREKTVERMARKTER_DEFAULTS, REGISTER_MAP.size + 1, 20),
+}
@@ -0,0 +1,73 @@
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(module)s - %(message)s'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Legt den LogRecord unformatiert in die Queue; Formatierung und Ausgabe übernimmt der Listener-Thread.
+
+    Argumente der Meldung werden erst dort eingesetzt und dürfen danach nicht mehr verändert werden.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, handler=None):
+    """Leitet das Root-Logging über eine Queue an einen Hintergrund-Thread um und liefert den gestarteten Listener.
+
+    Der Event-Loop reiht Meldungen nur noch ein; `listener.stop()` beim Beenden schreibt die restlichen Meldungen aus.
+    """
+    if handler is None:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class LogSampler:
+    """Begrenzt Meldungen pro Anfrage: je Schlüssel höchstens eine Meldung pro `interval` Sekunden.
+
+    `enabled(key)` vor dem Zusammenstellen der Meldung aufrufen, dann entfallen Dekodieren und Formatieren ganz,
+    wenn das Level abgeschaltet ist oder die Meldung verworfen würde. Verworfene Meldungen werden mitgezählt und
+    bei der nächsten durchgelassenen Meldung angehängt.
+    """
+
+    def __init__(self, logger, interval=1.0, level=logging.INFO):
+        self.logger = logger
+        self.interval = interval
+        self.level = level
+        self.last_logged = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def enabled(self, key):
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_logged.get(key, float('-inf')) < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last_logged[key] = now
+            return True
+
+    def log(self, key, msg, *args):
+        """Gibt eine zuvor mit `enabled(key)` freigegebene Meldung aus."""
+        with self.lock:
+            suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            msg += ' (%d weitere unterdrückt)'
+            args += (suppressed,)
+        self.logger.log(self.level, msg, *args, stacklevel=2)
@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import time
+
+# Obergrenzen der Latenz-Buckets in Sekunden
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Eingang der Anfrage, die im aktuellen Kontext ausgeführt wird. pymodbus ruft request_tracer in der Verbindung auf und
+# startet danach für die Anfrage einen eigenen Task, der eine Kopie dieses Kontexts erhält; response_manipulator läuft in
+# diesem Task. Jede Antwort findet so ihre eigene Startzeit, auch wenn mehrere Verbindungen dieselben Transaction IDs nutzen.
+_request_started = contextvars.ContextVar('request_started', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # letzter Eintrag: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class ServerMetrics:
+    """Anfragen, Fehlerantworten und Latenz pro (Function Code, Unit), abgelehnte Schreibzugriffe und aktive Verbindungen.
+
+    `trace_request` und `trace_response` werden dem pymodbus-Server als request_tracer und response_manipulator
+    übergeben; die Latenz reicht vom Eingang der Anfrage bis zum Absenden der Antwort.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.started = time.monotonic()
+        self.requests = {}  # (fc, unit) -> Anzahl
+        self.errors = {}  # (fc, unit) -> Anzahl Exception-Antworten
+        self.latency = {}  # (fc, unit) -> Histogram
+        self.rejected_writes = {}  # Grund -> Anzahl
+        self.connections = {}  # wird durch active_connections des Servers ersetzt
+
+    def trace_request(self, request, *addr):
+        key = (request.function_code, request.slave_id)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        _request_started.set(time.perf_counter())
+
+    def trace_response(self, response):
+        start = _request_started.get()
+        # Exception-Antworten tragen den Function Code mit gesetztem Bit 7
+        key = (response.function_code & 0x7F, response.slave_id)
+        if start is not None:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(self.buckets)
+            histogram.observe(time.perf_counter() - start)
+        if response.isError():
+            self.errors[key] = self.errors.get(key, 0) + 1
+        return response, False
+
+    def reject(self, reason):
+        self.rejected_writes[reason] = self.rejected_writes.get(reason, 0) + 1
+
+    def diagnostics(self):
+        """Kennzahlen für den Diagnose-Registerblock, Namen wie in REGISTER_MAP."""
+        count = sum(histogram.count for histogram in self.latency.values())
+        total = sum(histogram.sum for histogram in self.latency.values())
+        return {
+            'diag_requests': sum(self.requests.values()) & 0xFFFFFFFF,
+            'diag_errors': sum(self.errors.values()) & 0xFFFFFFFF,
+            'diag_rejected_writes': sum(self.rejected_writes.values()) & 0xFFFFFFFF,
+            'diag_active_connections': min(len(self.connections), 0xFFFF),
+            'diag_latency_mean_us': min(round(total / count * 1e6) if count else 0, 0xFFFFFFFF),
+            'diag_uptime': int(time.monotonic() - self.started) & 0xFFFFFFFF,
+        }
+
+    def render(self):
+        """Alle Kennzahlen im Prometheus-Textformat."""
+        lines = ['# TYPE modbus_requests_total counter']
+        for (fc, unit), value in sorted(self.requests.items()):
+            lines.append(f'modbus_requests_total{{function_code="{fc}",unit="{unit}"}} {value}')
+        lines.append('# TYPE modbus_errors_total counter')
+        for (fc, unit), value in sorted(self.errors.items()):
+            lines.append(f'modbus_errors_total{{function_code="{fc}",unit="{unit}"}} {value}')
+        lines.append('# TYPE modbus_request_duration_seconds histogram')
+        for (fc, unit), histogram in sorted(self.latency.items()):
+            labels = f'function_code="{fc}",unit="{unit}"'
+            cumulative = 0
+            for bound, value in zip(self.buckets + ('+Inf',), histogram.counts):
+                cumulative += value
+                lines.append(f'modbus_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'modbus_request_duration_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'modbus_request_duration_seconds_count{{{labels}}} {histogram.count}')
+        lines.append('# TYPE modbus_rejected_writes_total counter')
+        for reason, value in sorted(self.rejected_writes.items()):
+            lines.append(f'modbus_rejected_writes_total{{reason="{reason}"}} {value}')
+        lines.append('# TYPE modbus_active_connections gauge')
+        lines.append(f'modbus_active_connections {len(self.connections)}')
+        return '\n'.join(lines) + '\n'
+
+
+async def serve_metrics(metrics, host='127.0.0.1', port=9502):
+    """Minimaler HTTP-Endpunkt, der auf jede Anfrage `metrics.render()` liefert."""
+    async def handle(reader, writer):
+        try:
+            # Anfragezeile und Header lesen, der Pfad spielt keine Rolle
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            body = metrics.render().encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,49 @@
+import time
+
+
+class SetpointDispatcher:
+    """Merkt sich den zuletzt bestätigten Sollwert pro Gerät und schreibt nur, wenn der neue Wert das Totband verlässt."""
+
+    def __init__(self, deadband, max_age=None):
+        self.deadband = deadband
+        # Nach `max_age` Sekunden wird auch ein unveränderter Sollwert erneut geschrieben (None = nie)
+        self.max_age = max_age
+        self.acknowledged = {}  # device_id -> (setpoint, timestamp)
+
+    def needs_write(self, device_id, setpoint):
+        entry = self.acknowledged.get(device_id)
+        if entry is None:
+            return True
+        last_setpoint, timestamp = entry
+        if self.max_age is not None and time.monotonic() - timestamp >= self.max_age:
+            return True
+        return abs(setpoint - last_setpoint) > self.deadband
+
+    def acknowledge(self, device_id, setpoint):
+        self.acknowledged[device_id] = (setpoint, time.monotonic())
+
+    def invalidate(self, device_id=None):
+        if device_id is None:
+            self.acknowledged.clear()
+        else:
+            self.acknowledged.pop(device_id, None)
+
+    def dispatch(self, device_id, setpoint, write):
+        """Ruft `write(setpoint)` nur bei Bedarf auf. Nur der Rückgabewert True gilt als Bestätigung des Geräts."""
+        if not self.needs_write(device_id, setpoint):
+            return False
+        return self._confirm(device_id, setpoint, write(setpoint))
+
+    async def dispatch_async(self, device_id, setpoint, write):
+        """Wie dispatch, aber mit einer Coroutine-Funktion als `write`."""
+        if not self.needs_write(device_id, setpoint):
+            return False
+        return self._confirm(device_id, setpoint, await write(setpoint))
+
+    def _confirm(self, device_id, setpoint, result):
+        if result is not True:
+            # Unbestätigt: beim nächsten Zyklus erneut versuchen
+            self.invalidate(device_id)
+            return False
+        self.acknowledge(device_id, setpoint)
+        return True
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Die Skripte in src/ importieren sich gegenseitig über den Modulnamen
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -0,0 +1,68 @@
+import asyncio
+
+from refu_client import RefuClient
+
+
+class StandInInverter:
+    """Lokaler TCP-Ersatz für das REFU-Textprotokoll (eine Antwortzeile pro GetParameter)."""
+
+    def __init__(self, parameters=None, set_reply=None, delay=0.0, close_after=None, read_only=()):
+        self.parameters = dict(parameters or {})
+        self.read_only = set(read_only)  # SetParameter wird beantwortet, aber nicht übernommen
+        self.set_reply = set_reply  # Antwortzeile auf SetParameter, None: keine Antwort
+        self.delay = delay
+        self.close_after = close_after  # Verbindung nach so vielen Antworten schließen
+        self.commands = []
+        self.connections = 0
+        self.server = None
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        replies = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode().strip().partition(' ')
+                self.commands.append(line.decode().strip())
+                await asyncio.sleep(self.delay)
+                if command == 'REFU.SetParameter':
+                    parameter, _, value = argument.split(',')
+                    if int(parameter) not in self.read_only:
+                        self.parameters[int(parameter)] = float(value)
+                    if self.set_reply is None:
+                        continue
+                    reply = self.set_reply
+                else:
+                    reply = str(self.parameters.get(int(argument), 'ERROR'))
+                writer.write(reply.encode() + b'\n')
+                await writer.drain()
+                replies += 1
+                if self.close_after is not None and replies >= self.close_after:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_with_inverter(inverter, test, **client_options):
+    await inverter.start()
+    client = RefuClient(port=inverter.port, **client_options)
+    try:
+        return await test(client)
+    finally:
+        await client.close()
+        await inverter.stop()
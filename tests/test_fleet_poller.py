@@ -0,0 +1,58 @@
+import asyncio
+
+from fleet_poller import poll_fleet
+
+INVERTERS = [{'id': 'meter2'}, {'id': '192.168.0.221'}, {'id': '192.168.0.222'}]
+
+
+def run(fetch, **options):
+    return asyncio.run(poll_fleet(INVERTERS, fetch, **options))
+
+
+def test_results_in_configured_order():
+    async def fetch(inverter):
+        await asyncio.sleep(0.01 if inverter['id'] == 'meter2' else 0)
+        return inverter['id']
+
+    result = run(fetch)
+    assert list(result.values) == ['meter2', '192.168.0.221', '192.168.0.222']
+    assert result.missed == [] and result.failed == {}
+
+
+def test_deadline_and_failures():
+    async def fetch(inverter):
+        if inverter['id'] == '192.168.0.221':
+            raise OSError('refused')
+        if inverter['id'] == '192.168.0.222':
+            await asyncio.sleep(10)
+        return 1
+
+    result = run(fetch, deadline=0.1)
+    assert result.values == {'meter2': 1}
+    assert isinstance(result.failed['192.168.0.221'], OSError)
+    assert result.missed == ['192.168.0.222']
+
+
+def test_prepare_counts_against_deadline():
+    async def fetch(inverter):
+        await asyncio.sleep(0.1)
+        return 1
+
+    result = run(fetch, deadline=0.15, prepare=asyncio.sleep(0.1))
+    assert result.values == {}
+    assert len(result.missed) == 3
+
+
+def test_concurrency_limit():
+    running = []
+    peak = []
+
+    async def fetch(inverter):
+        running.append(inverter)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(inverter)
+        return 1
+
+    run(fetch, concurrency=2)
+    assert max(peak) == 2
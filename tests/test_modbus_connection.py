@@ -0,0 +1,193 @@
+import asyncio
+import socket
+
+import pytest
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ConnectionException
+from pymodbus.server import ModbusTcpServer
+
+import modbus_connection
+from modbus_connection import AsyncModbusConnectionManager, ModbusConnectionManager
+from register_datastore import build_server_context
+from retry_policy import RetryPolicy
+from server_config import SERVER_UNITS
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(modbus_connection, 'time', clock)
+    return clock
+
+
+class Response:
+    def __init__(self, error=False):
+        self.error = error
+
+    def isError(self):
+        return self.error
+
+
+class FakeClient:
+    """Ersetzt ModbusTcpClient; `connect_results` legt das Ergebnis der Verbindungsversuche der Reihe nach fest."""
+
+    instances = []
+
+    def __init__(self, host, port=502, timeout=3.0, **kwargs):
+        self.connect_results = [True] * 10
+        self.open = False
+        self.connects = 0
+        self.closes = 0
+        FakeClient.instances.append(self)
+
+    def connect(self):
+        self.connects += 1
+        self.open = self.connect_results.pop(0)
+        return self.open
+
+    def is_socket_open(self):
+        return self.open
+
+    def close(self):
+        self.closes += 1
+        self.open = False
+
+
+def manager(**options):
+    FakeClient.instances = []
+    retry_policy = RetryPolicy(attempts=2, base_delay=0.0, retry_on=(ConnectionException, OSError))
+    return ModbusConnectionManager(FakeClient, '127.0.0.1', retry_policy=retry_policy, **options)
+
+
+def test_connection_is_reused(clock):
+    connection = manager()
+    assert [connection.execute(lambda client: i) for i in range(3)] == [0, 1, 2]
+    client, = FakeClient.instances
+    assert client.connects == 1
+
+
+def test_reconnects_after_connection_error(clock):
+    connection = manager()
+    calls = []
+
+    def operation(client):
+        calls.append(client.connects)
+        if len(calls) == 1:
+            raise ConnectionException('reset')
+        return 'ok'
+
+    assert connection.execute(operation) == 'ok'
+    client, = FakeClient.instances
+    # Erster Versuch auf der ersten Verbindung, der zweite nach dem Neuaufbau
+    assert calls == [1, 2]
+    assert client.closes == 1
+
+
+def test_failed_connect_backs_off(clock):
+    connection = manager(min_reconnect_delay=0.5, max_reconnect_delay=2.0)
+    connection.execute(lambda client: None)
+    client, = FakeClient.instances
+    client.open = False
+    client.connect_results = [False, False, True]
+    with pytest.raises(ConnectionException):
+        connection.execute(lambda client: None)
+    # Der zweite Versuch der RetryPolicy fällt in die Wartezeit und verbindet nicht erneut
+    assert client.connects == 2
+    clock.now += 0.5
+    with pytest.raises(ConnectionException):
+        connection.execute(lambda client: None)
+    assert connection.reconnect_delay == 2.0
+    clock.now += 1.0
+    assert connection.execute(lambda client: 'ok') == 'ok'
+    assert connection.reconnect_delay == 0.5
+
+
+def test_failed_health_check_drops_idle_connection(clock):
+    probes = []
+    connection = manager(probe=lambda client: probes.append(client) or Response(error=len(probes) == 1),
+                         health_check_interval=30.0)
+    connection.execute(lambda client: None)
+    clock.now += 31.0
+    assert connection.execute(lambda client: 'ok') == 'ok'
+    client, = FakeClient.instances
+    assert len(probes) == 1
+    assert client.connects == 2
+
+
+class FakeAsyncClient(FakeClient):
+    """Ersetzt AsyncModbusTcpClient."""
+
+    async def connect(self):
+        return FakeClient.connect(self)
+
+    @property
+    def connected(self):
+        return self.open
+
+
+def async_manager(client_factory=FakeAsyncClient, port=502, **options):
+    FakeClient.instances = []
+    retry_policy = RetryPolicy(attempts=2, base_delay=0.0, retry_on=(ConnectionException, OSError, asyncio.TimeoutError))
+    return AsyncModbusConnectionManager(client_factory, '127.0.0.1', port=port, retry_policy=retry_policy, **options)
+
+
+async def answer(value, delay=0.0):
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_async_connection_is_reused(clock):
+    connection = async_manager()
+
+    async def test():
+        return [await connection.execute(lambda client: answer(i)) for i in range(3)]
+
+    assert asyncio.run(test()) == [0, 1, 2]
+    client, = FakeClient.instances
+    assert client.connects == 1
+
+
+def test_async_timeout_drops_connection(clock):
+    connection = async_manager(timeout=0.05)
+    delays = [1.0, 0.0]
+
+    async def test():
+        return await connection.execute(lambda client: answer('ok', delays.pop(0)))
+
+    assert asyncio.run(test()) == 'ok'
+    client, = FakeClient.instances
+    # Späte Antworten der abgebrochenen Anfrage dürfen nicht auf derselben Verbindung ankommen
+    assert client.closes == 1
+    assert client.connects == 2
+
+
+def test_async_manager_against_modbus_server():
+    context, units = build_server_context(SERVER_UNITS)
+    units[5].set_points({'active_power': 12.5})
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    async def test():
+        server = ModbusTcpServer(context, address=('127.0.0.1', port))
+        await server.listen()
+        connection = async_manager(AsyncModbusTcpClient, port=port, timeout=1.0)
+        try:
+            responses = [await connection.execute(lambda client: client.read_input_registers(0, 2, slave=5))
+                         for _ in range(2)]
+            return [response.registers for response in responses], connection.connected
+        finally:
+            connection.close()
+            await server.shutdown()
+
+    registers, connected = asyncio.run(test())
+    assert registers == [[0x4148, 0x0000]] * 2
+    assert connected
@@ -0,0 +1,70 @@
+import requests
+
+from metadata_cache import MetadataCache
+from openems_api_client import OpenEmsClient
+from retry_policy import CircuitBreakerRegistry, RetryPolicy
+
+
+class StandInEdge:
+    """Antwortet auf GET-Anfragen der Reihe nach mit den vorgegebenen Sammelergebnissen."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.requests = []
+
+    def __call__(self, url):
+        self.requests.append(url)
+        return [{'address': f'{component_id}/MaxApparentPower', 'value': value}
+                for component_id, value in self.answers.pop(0).items()]
+
+
+def client_with(monkeypatch, answers):
+    client = OpenEmsClient('127.0.0.1', cache=MetadataCache({'MaxApparentPower': 3600.0}))
+    edge = StandInEdge(answers)
+    monkeypatch.setattr(client, '_get', edge)
+    return client, edge
+
+
+def test_partial_pattern_result_is_not_served_from_cache(monkeypatch):
+    client, edge = client_with(monkeypatch, [{'meter2': 1000}, {'meter2': 1000, 'meter3': 2000}])
+    component_ids = ['meter2', 'meter3']
+    assert client.read_channels('meter.*', 'MaxApparentPower', component_ids) == {'meter2': 1000}
+    assert client.read_channels('meter.*', 'MaxApparentPower', component_ids) == {'meter2': 1000, 'meter3': 2000}
+    assert len(edge.requests) == 2
+
+
+def test_complete_result_is_cached_per_component(monkeypatch):
+    client, edge = client_with(monkeypatch, [{'meter2': 1000, 'meter3': 2000}])
+    component_ids = ['meter2', 'meter3']
+    client.read_channels('meter.*', 'MaxApparentPower', component_ids)
+    assert client.read_channels('meter.*', 'MaxApparentPower', component_ids) == {'meter2': 1000, 'meter3': 2000}
+    assert client.read_channel('meter3', 'MaxApparentPower') == 2000
+    assert len(edge.requests) == 1
+
+
+def test_empty_result_is_not_cached(monkeypatch):
+    client, edge = client_with(monkeypatch, [{}, {'meter2': 1000}])
+    assert client.read_channels('meter.*', 'MaxApparentPower', ['meter2']) == {}
+    assert client.read_channels('meter.*', 'MaxApparentPower', ['meter2']) == {'meter2': 1000}
+    assert len(edge.requests) == 2
+
+
+def error_response(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = b'rejected'
+    return response
+
+
+def test_rejected_writes_open_the_breaker(monkeypatch):
+    breakers = CircuitBreakerRegistry(failure_threshold=5, reset_timeout=30.0)
+    retry_policy = RetryPolicy(attempts=1, base_delay=0.0, retry_on=(requests.RequestException,))
+    client = OpenEmsClient('127.0.0.1', retry_policy=retry_policy, breakers=breakers)
+    posts = []
+    monkeypatch.setattr(client.session, 'post', lambda url, **kwargs: posts.append(url) or error_response(500))
+    for _ in range(5):
+        assert client.write_channel_value('meter2', 'SetActivePower', 500) is None
+    assert breakers.get('meter2').is_open
+    # Bei offenem Breaker wird nicht mehr geschrieben
+    assert client.write_channel_value('meter2', 'SetActivePower', 500) is None
+    assert len(posts) == 5
@@ -0,0 +1,93 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from openems_async_client import AsyncOpenEmsClient
+from retry_policy import CircuitBreakerRegistry, RetryPolicy
+
+
+class StandInEdge:
+    """Lokaler Ersatz für die REST-Schnittstelle des OpenEMS Edge."""
+
+    def __init__(self, delay=0.0, write_status=200):
+        self.delay = delay
+        self.write_status = write_status
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.writes = []
+
+    async def read(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        component, channel = request.match_info['component'], request.match_info['channel']
+        if component == 'meter.*':
+            return web.json_response([{'address': f'meter{i}/{channel}', 'value': i * 100} for i in (2, 3)])
+        return web.json_response({'address': f'{component}/{channel}', 'value': 42})
+
+    async def write(self, request):
+        body = await request.json()
+        self.writes.append((request.match_info['component'], body['value']))
+        if self.write_status != 200:
+            return web.Response(status=self.write_status, text='rejected')
+        return web.json_response({'value': body['value']})
+
+
+async def run_with_edge(edge, test, **client_options):
+    app = web.Application()
+    app.router.add_get('/rest/channel/{component}/{channel}', edge.read)
+    app.router.add_post('/rest/channel/{component}/{channel}', edge.write)
+    server = TestServer(app, host='127.0.0.1')
+    await server.start_server()
+    client = AsyncOpenEmsClient('127.0.0.1', port=server.port, **client_options)
+    try:
+        return await test(client)
+    finally:
+        await client.close()
+        await server.close()
+
+
+def test_concurrency_limit():
+    edge = StandInEdge(delay=0.05)
+
+    async def test(client):
+        return await client.read_many([(f'meter{i}', 'ActivePower') for i in range(10)])
+
+    values = asyncio.run(run_with_edge(edge, test, concurrency=3))
+    assert set(values.values()) == {42}
+    assert edge.max_in_flight == 3
+
+
+def test_read_channels_pattern():
+    async def test(client):
+        return await client.read_channels('meter.*', 'ActivePower')
+
+    assert asyncio.run(run_with_edge(StandInEdge(), test)) == {'meter2': 200, 'meter3': 300}
+
+
+def test_rejected_write_counts_as_failure():
+    edge = StandInEdge(write_status=500)
+    breakers = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=60.0)
+    retry_policy = RetryPolicy(attempts=2, base_delay=0.0, retry_on=(aiohttp.ClientError,))
+
+    async def test(client):
+        return await client.write_channel_value('meter2', 'SetActivePower', 500)
+
+    result = asyncio.run(run_with_edge(edge, test, retry_policy=retry_policy, breakers=breakers))
+    assert result is None
+    assert len(edge.writes) == 2
+    assert breakers.get('meter2').is_open
+
+
+def test_post_raises_on_error_status():
+    async def test(client):
+        await client._post(client.channel_url('meter2', 'SetActivePower'), 1)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(run_with_edge(StandInEdge(write_status=403), test))
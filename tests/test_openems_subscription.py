@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import openems_subscription
+from openems_subscription import LatestValueStore, OpenEmsSubscription
+
+CHANNELS = ['meter2/ActivePower', 'meter3/ActivePower']
+
+
+class FakeTime:
+    """Ersetzt nur das `time`-Modul des Stores; der Event-Loop braucht die echte Uhr."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(openems_subscription, 'time', clock)
+    return clock
+
+
+class StandInEdge:
+    """Lokaler Ersatz für die JSON-RPC-Websocket-Schnittstelle des OpenEMS Edge."""
+
+    def __init__(self, data, reject_first_login=False):
+        self.data = data
+        self.reject_first_login = reject_first_login
+        self.logins = 0
+        self.subscriptions = []
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        login = await ws.receive_json()
+        self.logins += 1
+        if self.reject_first_login and self.logins == 1:
+            await ws.send_json({'jsonrpc': '2.0', 'id': login['id'], 'error': {'message': 'denied'}})
+            await ws.close()
+            return ws
+        await ws.send_json({'jsonrpc': '2.0', 'id': login['id'], 'result': {}})
+        rpc = await ws.receive_json()
+        self.subscriptions.append(rpc['params']['payload']['params']['channels'])
+        # Benachrichtigung vor der Antwort: wird während des Aufrufs verarbeitet
+        await ws.send_json({'jsonrpc': '2.0', 'method': 'edgeRpc',
+                            'params': {'payload': {'method': 'currentData', 'params': self.data}}})
+        await ws.send_json({'jsonrpc': '2.0', 'id': rpc['id'], 'result': {}})
+        await ws.close()
+        return ws
+
+
+async def run_with_edge(edge, test):
+    app = web.Application()
+    app.router.add_get('/', edge.handle)
+    server = TestServer(app, host='127.0.0.1')
+    await server.start_server()
+    subscription = OpenEmsSubscription('127.0.0.1', CHANNELS, port=server.port, reconnect_delay=0.01)
+    task = asyncio.ensure_future(subscription.run())
+    try:
+        return await test(subscription)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await server.close()
+
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('Bedingung nicht erfüllt')
+
+
+def test_stream_fills_store(clock):
+    edge = StandInEdge({'meter2/ActivePower': 100, 'meter3/ActivePower': 200})
+
+    async def test(subscription):
+        await wait_for(lambda: subscription.store.values)
+        return subscription.store.fresh_values(CHANNELS, 5.0)
+
+    assert asyncio.run(run_with_edge(edge, test)) == {'meter2/ActivePower': 100, 'meter3/ActivePower': 200}
+    assert edge.subscriptions[0] == CHANNELS
+
+
+def test_stale_or_missing_values_fall_back_to_rest(clock):
+    edge = StandInEdge({'meter2/ActivePower': 100})
+
+    async def test(subscription):
+        await wait_for(lambda: subscription.store.values)
+        # meter3 fehlt im Stream: Aufrufer lesen alle Zähler per REST
+        return subscription.store.fresh_values(CHANNELS, 5.0)
+
+    assert asyncio.run(run_with_edge(edge, test)) is None
+
+
+def test_reconnects_after_rpc_error(clock):
+    edge = StandInEdge({'meter2/ActivePower': 100, 'meter3/ActivePower': 200}, reject_first_login=True)
+
+    async def test(subscription):
+        await wait_for(lambda: subscription.store.values)
+        return edge.logins
+
+    assert asyncio.run(run_with_edge(edge, test)) >= 2
+
+
+def test_values_expire_after_max_age(clock):
+    store = LatestValueStore()
+    store.update({'meter2/ActivePower': 100, 'meter3/ActivePower': 200})
+    clock.now += 5.0
+    assert store.fresh_values(CHANNELS, 5.0) == {'meter2/ActivePower': 100, 'meter3/ActivePower': 200}
+    clock.now += 0.1
+    assert store.fresh_values(CHANNELS, 5.0) is None
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+import peak_power_cache
+from peak_power_cache import PeakPowerCache
+from refu_stand_in import StandInInverter, run_with_inverter
+
+HOST = '127.0.0.1'
+NOMINAL_POWER_PARAMETER = 1200
+
+
+class FakeTime:
+    """Ersetzt nur das `time`-Modul des Caches; der Event-Loop braucht die echte Uhr."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(peak_power_cache, 'time', clock)
+    return clock
+
+
+def nameplate_reads(inverter):
+    return inverter.commands.count(f'REFU.GetParameter {NOMINAL_POWER_PARAMETER}')
+
+
+def test_refresh_reads_again_after_ttl(clock):
+    inverter = StandInInverter({NOMINAL_POWER_PARAMETER: 30000})
+    messages = []
+
+    async def test(client):
+        cache = PeakPowerCache(client, messages.append, parameter=NOMINAL_POWER_PARAMETER, ttl=3600.0)
+        await cache.refresh([HOST])
+        clock.now += 3599.0
+        inverter.parameters[NOMINAL_POWER_PARAMETER] = 25000
+        await cache.refresh([HOST])
+        before_ttl = cache.get(HOST)
+        clock.now += 1.0
+        await cache.refresh([HOST])
+        return before_ttl, cache.get(HOST)
+
+    assert asyncio.run(run_with_inverter(inverter, test)) == (30000, 25000)
+    assert nameplate_reads(inverter) == 2
+    assert messages == []
+
+
+@pytest.mark.parametrize('reply', [0, 150000, 'ERROR'])
+def test_implausible_values_are_rejected(clock, reply):
+    inverter = StandInInverter({NOMINAL_POWER_PARAMETER: reply})
+    messages = []
+
+    async def test(client):
+        cache = PeakPowerCache(client, messages.append, parameter=NOMINAL_POWER_PARAMETER)
+        await cache.refresh([HOST])
+        return cache.get(HOST), cache.total([HOST], 20000)
+
+    assert asyncio.run(run_with_inverter(inverter, test)) == (None, 20000)
+    assert len(messages) == 1 and 'Implausible peak power' in messages[0]
+
+
+def test_total_uses_default_for_unknown_hosts(clock):
+    inverter = StandInInverter({NOMINAL_POWER_PARAMETER: 30000})
+
+    async def test(client):
+        cache = PeakPowerCache(client, print, parameter=NOMINAL_POWER_PARAMETER)
+        await cache.refresh([HOST])
+        return cache.total([HOST, '192.0.2.1'], 20000)
+
+    assert asyncio.run(run_with_inverter(inverter, test)) == 50000
+
+
+def test_run_refreshes_in_background(clock):
+    inverter = StandInInverter({NOMINAL_POWER_PARAMETER: 30000})
+
+    async def test(client):
+        cache = PeakPowerCache(client, print, parameter=NOMINAL_POWER_PARAMETER, refresh_interval=0.01)
+        task = asyncio.ensure_future(cache.run(lambda: [HOST]))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return cache.get(HOST)
+
+    assert asyncio.run(run_with_inverter(inverter, test)) == 30000
+    # Innerhalb der TTL wird nicht erneut gelesen
+    assert nameplate_reads(inverter) == 1
+
+
+def test_run_without_parameter_reports_disabled_discovery():
+    messages = []
+    cache = PeakPowerCache(None, messages.append)
+    asyncio.run(asyncio.wait_for(cache.run(lambda: [HOST]), 1.0))
+    assert len(messages) == 1 and 'disabled' in messages[0]
+    assert cache.total([HOST, HOST], 20000) == 40000
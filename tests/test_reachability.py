@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import reachability
+from reachability import ReachabilityCache
+
+# Der Stand-in-Server hört nur auf 127.0.0.1, Verbindungen zu 127.0.0.2 werden abgewiesen
+REACHABLE = '127.0.0.1'
+UNREACHABLE = '127.0.0.2'
+
+
+class FakeTime:
+    """Ersetzt nur das `time`-Modul des Caches; der Event-Loop braucht die echte Uhr."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(reachability, 'time', clock)
+    return clock
+
+
+async def run_with_listener(test):
+    connections = []
+
+    async def accept(reader, writer):
+        connections.append(writer)
+        writer.close()
+
+    server = await asyncio.start_server(accept, REACHABLE, 0)
+    try:
+        return await test(server.sockets[0].getsockname()[1], connections)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_probe_all(clock):
+    async def test(port, connections):
+        cache = ReachabilityCache(port, timeout=0.5)
+        return await cache.probe_all([REACHABLE, UNREACHABLE]), cache
+
+    results, cache = asyncio.run(run_with_listener(test))
+    assert results == {REACHABLE: True, UNREACHABLE: False}
+    assert cache.is_reachable(REACHABLE)
+    assert not cache.is_reachable(UNREACHABLE)
+
+
+def test_refresh_probes_only_stale_hosts(clock):
+    async def test(port, connections):
+        cache = ReachabilityCache(port, ttl=30.0, timeout=0.5)
+        await cache.refresh([REACHABLE])
+        clock.now += 29.0
+        await cache.refresh([REACHABLE])
+        probes_within_ttl = len(connections)
+        clock.now += 1.0
+        await cache.refresh([REACHABLE])
+        return probes_within_ttl, len(connections)
+
+    assert asyncio.run(run_with_listener(test)) == (1, 2)
+
+
+def test_unknown_hosts_count_as_reachable(clock):
+    cache = ReachabilityCache(502)
+    assert cache.is_reachable(REACHABLE)
+    cache.mark(REACHABLE, False)
+    assert not cache.is_reachable(REACHABLE)
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from refu_client import REFU_PARAM_ACTIVE_POWER, REFU_PARAM_POWER_LIMIT, RefuParameterSet, to_int
+from refu_stand_in import StandInInverter, run_with_inverter
+
+HOST = '127.0.0.1'
+
+
+def test_batch_read_in_one_session():
+    inverter = StandInInverter({REFU_PARAM_ACTIVE_POWER: 1234, 1200: 'abc'})
+    parameter_set = RefuParameterSet('Record', [('power', REFU_PARAM_ACTIVE_POWER, to_int), ('other', 1200, to_int)])
+
+    async def test(client):
+        return await client.read(HOST, parameter_set)
+
+    record = asyncio.run(run_with_inverter(inverter, test))
+    assert (record.host, record.power, record.other) == (HOST, 1234, None)
+    assert inverter.commands == [f'REFU.GetParameter {REFU_PARAM_ACTIVE_POWER}', 'REFU.GetParameter 1200']
+
+
+def test_connection_is_reused():
+    inverter = StandInInverter({REFU_PARAM_ACTIVE_POWER: 10})
+
+    async def test(client):
+        return [await client.get_current_power(HOST) for _ in range(3)]
+
+    assert asyncio.run(run_with_inverter(inverter, test)) == [10, 10, 10]
+    assert inverter.connections == 1
+
+
+def test_reconnect_after_inverter_closes():
+    inverter = StandInInverter({REFU_PARAM_ACTIVE_POWER: 10}, close_after=1)
+
+    async def test(client):
+        first = await client.get_current_power(HOST)
+        # Der Wechselrichter hat die Verbindung inzwischen geschlossen
+        await asyncio.sleep(0.05)
+        return first, await client.get_current_power(HOST)
+
+    assert asyncio.run(run_with_inverter(inverter, test)) == (10, 10)
+    assert inverter.connections == 2
+
+
+def test_cancel_drops_connection():
+    inverter = StandInInverter({REFU_PARAM_ACTIVE_POWER: 10, REFU_PARAM_POWER_LIMIT: 500}, delay=0.1)
+
+    async def test(client):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.get_current_power(HOST), 0.02)
+        assert not client.connections[HOST].is_open
+        # Die verspätete Antwort auf die abgebrochene Anfrage darf nicht hier ankommen
+        return await client.get_parameter(HOST, REFU_PARAM_POWER_LIMIT)
+
+    assert asyncio.run(run_with_inverter(inverter, test)) == '500'
+    assert inverter.connections == 2
+
+
+@pytest.mark.parametrize('set_reply', [None, 'OK'])
+def test_set_power_limit_sends_set_once(set_reply):
+    inverter = StandInInverter({REFU_PARAM_POWER_LIMIT: 0}, set_reply=set_reply)
+
+    async def test(client):
+        return await client.set_power_limit(HOST, 0.75), await client.get_parameter(HOST, REFU_PARAM_POWER_LIMIT)
+
+    confirmed, readback = asyncio.run(run_with_inverter(inverter, test, set_reply_timeout=0.05))
+    assert confirmed
+    assert readback == '750.0'
+    assert inverter.commands.count(f'REFU.SetParameter {REFU_PARAM_POWER_LIMIT},0,750.0') == 1
+
+
+def test_set_power_limit_reports_rejected_value():
+    inverter = StandInInverter({REFU_PARAM_POWER_LIMIT: 0}, read_only=[REFU_PARAM_POWER_LIMIT])
+
+    async def test(client):
+        return await client.set_power_limit(HOST, 0.75)
+
+    assert asyncio.run(run_with_inverter(inverter, test, set_reply_timeout=0.05)) is False
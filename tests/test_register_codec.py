@@ -0,0 +1,61 @@
+import math
+
+import pytest
+
+from register_codec import (FLOAT32, INT32, UINT16, WORD_ORDER_LITTLE, BitfieldCodec, BlockCodec, decode_array,
+                            encode_array, get_codec)
+
+
+def test_float32_big_word_order():
+    # 100.0 = 0x42C80000, höherwertiges Wort zuerst
+    assert FLOAT32.encode(100.0) == [0x42C8, 0x0000]
+    assert FLOAT32.decode([0x42C8, 0x0000]) == 100.0
+
+
+def test_little_word_order_swaps_words():
+    codec = get_codec('float32', WORD_ORDER_LITTLE)
+    assert codec.encode(100.0) == [0x0000, 0x42C8]
+    assert codec.decode([0x0000, 0x42C8]) == 100.0
+
+
+@pytest.mark.parametrize('codec, value', [(INT32, -123456), (UINT16, 65535), (get_codec('uint32'), 4000000000)])
+def test_scalar_round_trip(codec, value):
+    assert codec.decode(codec.encode(value)) == value
+
+
+def test_codecs_are_cached():
+    assert get_codec('float32') is FLOAT32
+
+
+def test_bitfield():
+    codec = BitfieldCodec([0, 8, 12])
+    register = codec.encode({0: True, 12: True})
+    assert register == [0x1001]
+    assert codec.decode(register) == {0: True, 8: False, 12: True}
+    assert codec.encode({0: False}, register[0]) == [0x1000]
+
+
+@pytest.mark.parametrize('word_order', ['big', WORD_ORDER_LITTLE])
+def test_block_codec_round_trip(word_order):
+    codec = BlockCodec(['float32', 'uint16', 'int32', 'uint16'], word_order)
+    values = [1.5, 7, -2, 65535]
+    registers = codec.encode(values)
+    assert len(registers) == codec.count == 6
+    assert codec.decode(registers) == values
+
+
+def test_block_codec_matches_scalar_codecs():
+    codec = BlockCodec(['float32', 'uint16'])
+    assert codec.encode([2.25, 9]) == FLOAT32.encode(2.25) + UINT16.encode(9)
+
+
+@pytest.mark.parametrize('word_order', ['big', WORD_ORDER_LITTLE])
+def test_arrays(word_order):
+    values = [0.0, -1.5, 1e10]
+    registers = encode_array('float32', values, word_order)
+    assert registers[:2] == get_codec('float32', word_order).encode(0.0)
+    assert decode_array('float32', registers, word_order) == values
+
+
+def test_decode_array_nan():
+    assert math.isnan(decode_array('float32', [0x7FC0, 0])[0])
@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+from register_codec import FLOAT32
+from register_datastore import RegisterMapDataBlock, RegisterMapSlaveContext, build_server_context
+from register_map import REGISTER_MAP, Point, RegisterMap
+from server_config import UnitConfig
+
+
+def input_block(**options):
+    return RegisterMapDataBlock(REGISTER_MAP, 4, REGISTER_MAP.size + 1, **options)
+
+
+def test_points_are_offset_by_one():
+    block = input_block()
+    block.setValues(1, FLOAT32.encode(12.5))
+    assert block.get_point('active_power') == 12.5
+    assert block.changed == {'active_power': 12.5}
+
+
+def test_bool_points_share_a_register():
+    block = input_block()
+    block.set_points({'call_signal': True, 'ready_signal': True})
+    assert block.values[7] == 0x1001
+    block.set_point('call_signal', False)
+    assert block.typed['call_signal'] is False
+    assert block.typed['ready_signal'] is True
+
+
+def test_multi_point_write_decodes_all_points():
+    block = input_block()
+    registers = FLOAT32.encode(1.0) + FLOAT32.encode(2.0) + FLOAT32.encode(3.0) + [0x0100]
+    block.setValues(1, registers)
+    assert block.changed == {'active_power': 1.0, 'grid_operator_limit': 2.0, 'wind_speed': 3.0,
+                             'call_signal': False, 'operating_signal': True, 'ready_signal': False}
+
+
+def test_write_outside_block_is_rejected():
+    block = input_block()
+    size = len(block.values)
+    with pytest.raises(ValueError):
+        block.set_many([(1, [1, 2]), (size, [1, 2])])
+    assert len(block.values) == size
+    assert block.values[1:3] == [0, 0]
+
+
+def test_snapshot_keeps_published_image():
+    block = input_block(snapshot=True)
+    values, typed = block.image
+    block.set_point('active_power', 5.0)
+    assert typed['active_power'] == 0.0
+    assert values[1:3] == [0, 0]
+    assert block.image[1]['active_power'] == 5.0
+
+
+def test_snapshot_readers_never_see_torn_floats():
+    block = input_block(snapshot=True)
+    first, second = FLOAT32.encode(1.0), FLOAT32.encode(-2.0)
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            block.setValues(1, first)
+            block.setValues(1, second)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(20000):
+            values, typed = block.image
+            assert values[1:3] in (first, second)
+            assert FLOAT32.decode(values[1:3]) == typed['active_power']
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_listeners_get_changed_points():
+    block = input_block()
+    calls = []
+    block.listeners.append(calls.append)
+    block.set_point('wind_speed', 4.0)
+    block.setValues(50, [1])  # kein Datenpunkt
+    assert calls == [{'wind_speed': 4.0}]
+
+
+def test_modify_returns_previous_values():
+    block = input_block()
+    block.setValues(7, [0x0001])
+    assert block.modify(7, 1, lambda registers: [registers[0] | 0x0100]) == [0x0001]
+    assert block.typed['operating_signal'] is True
+
+
+def test_build_server_context_per_unit_maps():
+    small_map = RegisterMap([Point('power', 0, 'float32', 4, None), Point('limit', 0, 'float32', 3, None)])
+    context, units = build_server_context({
+        5: UnitConfig('Direktvermarkter', REGISTER_MAP, {}, REGISTER_MAP.size + 1, 20),
+        6: UnitConfig('Speicher', small_map, {}, 3, 3),
+    })
+    assert set(units) == {5, 6}
+    assert len(units[6].input_block.values) == 3
+    units[6].set_points({'power': 1.0, 'limit': 2.0})
+    assert units[6].input_block.typed == {'power': 1.0}
+    assert units[5].input_block.typed['active_power'] == 0.0
+    assert context[6] is units[6]
+
+
+def test_image_dir_restores_registers(tmp_path):
+    unit = RegisterMapSlaveContext(REGISTER_MAP, REGISTER_MAP.size + 1, 20, unit_id=5, image_dir=str(tmp_path))
+    assert not unit.restored
+    unit.set_points({'active_power': 7.5, 'set_point': 0.25, 'polling_activation': True})
+    unit.flush()
+    restored = RegisterMapSlaveContext(REGISTER_MAP, REGISTER_MAP.size + 1, 20, unit_id=5, image_dir=str(tmp_path))
+    assert restored.restored
+    assert restored.input_block.typed['active_power'] == 7.5
+    assert restored.holding_block.typed == {'set_point': 0.25, 'polling_activation': True}
+
+
+def test_points_in_returns_typed_values_of_the_read_range():
+    unit = RegisterMapSlaveContext(REGISTER_MAP, REGISTER_MAP.size + 1, 20, unit_id=5)
+    unit.set_points({'diag_requests': 70000, 'diag_active_connections': 2, 'set_point': 0.5, 'polling_activation': True})
+    # Diagnoseblock: uint32 und uint16, nicht als float32 dekodiert
+    assert unit.points_in(4, 100, 7) == {'diag_requests': 70000, 'diag_errors': 0, 'diag_rejected_writes': 0,
+                                         'diag_active_connections': 2}
+    assert unit.points_in(3, 10, 4) == {'set_point': 0.5, 'polling_activation': True}
+    assert unit.points_in(4, 50, 2) == {}
+    assert unit.points_in(1, 0, 8) == {}
@@ -0,0 +1,53 @@
+from register_image import MappedRegisterImage, layout_checksum
+from register_map import REGISTER_MAP, Point, RegisterMap
+
+
+def test_new_image_is_empty(tmp_path):
+    image = MappedRegisterImage(str(tmp_path / 'unit5_input.img'), 8, layout=1)
+    assert not image.restored
+    assert image.load() == [0] * 8
+    image.close()
+
+
+def test_image_is_restored_after_reopen(tmp_path):
+    path = str(tmp_path / 'unit5_input.img')
+    image = MappedRegisterImage(path, 8, layout=1)
+    image.write(2, [0x42C8, 0, 65535])
+    image.flush()
+    image.close()
+    image = MappedRegisterImage(path, 8, layout=1)
+    assert image.restored
+    assert image.load() == [0, 0, 0x42C8, 0, 65535, 0, 0, 0]
+    image.close()
+
+
+def test_layout_mismatch_resets_image(tmp_path):
+    path = str(tmp_path / 'unit5_input.img')
+    image = MappedRegisterImage(path, 8, layout=1)
+    image.write(0, [7])
+    image.close()
+    image = MappedRegisterImage(path, 8, layout=2)
+    assert not image.restored
+    assert image.load() == [0] * 8
+    image.close()
+
+
+def test_size_mismatch_resets_image(tmp_path):
+    path = str(tmp_path / 'unit5_input.img')
+    image = MappedRegisterImage(path, 8, layout=1)
+    image.write(0, [7])
+    image.close()
+    image = MappedRegisterImage(path, 10, layout=1)
+    assert not image.restored
+    assert image.load() == [0] * 10
+    image.close()
+
+
+def test_layout_checksum_tracks_points():
+    changed = RegisterMap(REGISTER_MAP.points[:-1])
+    assert layout_checksum(REGISTER_MAP, 4) == layout_checksum(RegisterMap(REGISTER_MAP.points), 4)
+    assert layout_checksum(REGISTER_MAP, 4) != layout_checksum(changed, 4)
+    # Holding-Register bleiben unverändert, wenn sich nur Input-Register-Punkte ändern
+    assert layout_checksum(REGISTER_MAP, 3) == layout_checksum(changed, 3)
+    assert layout_checksum(REGISTER_MAP, 3) != layout_checksum(
+        RegisterMap(REGISTER_MAP.points + [Point('extra', 14, 'uint16', 3, None)]), 3)
@@ -0,0 +1,29 @@
+from register_codec import FLOAT32
+from register_map import MAX_READ_COUNT, REGISTER_MAP, Point, RegisterMap
+
+
+def test_points_within_gap_share_one_read():
+    blocks = REGISTER_MAP.plan_reads(['active_power', 'wind_speed', 'available_power'])
+    assert [(block.function_code, block.address, block.count) for block in blocks] == [(4, 0, 10)]
+    assert [point.name for point in blocks[0].points] == ['active_power', 'wind_speed', 'available_power']
+
+
+def test_function_codes_and_large_gaps_split_reads():
+    blocks = REGISTER_MAP.plan_reads(['set_point', 'polling_activation', 'active_power', 'diag_requests'])
+    assert [(block.function_code, block.address, block.count) for block in blocks] == [
+        (3, 10, 3), (4, 0, 2), (4, 100, 2)]
+
+
+def test_reads_respect_max_read_count():
+    register_map = RegisterMap([Point(f'p{i}', i * 2, 'float32', 4, None) for i in range(100)])
+    blocks = register_map.plan_reads()
+    assert [block.count for block in blocks] == [124, 76]
+    assert all(block.count <= MAX_READ_COUNT for block in blocks)
+    assert sum(len(block.points) for block in blocks) == 100
+
+
+def test_decode_block():
+    block, = REGISTER_MAP.plan_reads(['active_power', 'call_signal', 'ready_signal'])
+    registers = FLOAT32.encode(250.0) + [0] * 4 + [0x1000]
+    assert REGISTER_MAP.decode_block(block, registers) == {'active_power': 250.0, 'call_signal': False,
+                                                           'ready_signal': True}
@@ -0,0 +1,64 @@
+import pytest
+
+from register_codec import FLOAT32
+from register_datastore import RegisterMapSlaveContext
+from register_map import REGISTER_MAP
+from register_mirror import MirrorRule, RegisterMirror
+
+
+@pytest.fixture
+def unit():
+    return RegisterMapSlaveContext(REGISTER_MAP, REGISTER_MAP.size + 1, 20, unit_id=5)
+
+
+def holding_write(unit, address, values):
+    unit.holding_block.setValues(address + unit.holding_block.offset, values)
+
+
+def test_full_write_is_mirrored(unit):
+    mirror = RegisterMirror([MirrorRule(0, 2, 0, None)])
+    holding_write(unit, 0, FLOAT32.encode(42.0))
+    changed = mirror.apply(unit.holding_block, unit.input_block, 0, FLOAT32.encode(42.0))
+    assert changed == {'active_power': 42.0}
+    assert unit.input_block.typed['active_power'] == 42.0
+
+
+def test_partial_write_reads_rest_from_source(unit):
+    mirror = RegisterMirror([MirrorRule(0, 2, 0, None)])
+    registers = FLOAT32.encode(3.5)
+    holding_write(unit, 0, registers)
+    holding_write(unit, 1, registers[1:])
+    mirror.apply(unit.holding_block, unit.input_block, 1, registers[1:])
+    assert unit.input_block.typed['active_power'] == 3.5
+
+
+def test_unrelated_write_is_ignored(unit):
+    mirror = RegisterMirror([MirrorRule(0, 2, 0, None)])
+    assert mirror.apply(unit.holding_block, unit.input_block, 10, [1, 2]) == {}
+    assert mirror.rules_for(10, 2) == []
+
+
+def test_rules_are_applied_in_one_write(unit):
+    mirror = RegisterMirror([MirrorRule(0, 2, 0, None), MirrorRule(2, 2, 8, lambda registers: registers[::-1])])
+    calls = []
+    unit.input_block.listeners.append(calls.append)
+    values = FLOAT32.encode(1.0) + FLOAT32.encode(2.0)[::-1]
+    holding_write(unit, 0, values)
+    mirror.apply(unit.holding_block, unit.input_block, 0, values)
+    assert calls == [{'active_power': 1.0, 'available_power': 2.0}]
+
+
+def test_transform_must_keep_register_count(unit):
+    mirror = RegisterMirror([MirrorRule(0, 2, 0, lambda registers: registers[:1])])
+    with pytest.raises(ValueError):
+        mirror.apply(unit.holding_block, unit.input_block, 0, [1, 2])
+
+
+@pytest.mark.parametrize('rule', [MirrorRule(2, 2, 500, None), MirrorRule(19, 2, 0, None), MirrorRule(-1, 2, 0, None)])
+def test_rules_outside_blocks_are_rejected(unit, rule):
+    with pytest.raises(ValueError):
+        RegisterMirror([rule]).validate(unit.holding_block, unit.input_block)
+
+
+def test_valid_rules_pass(unit):
+    RegisterMirror([MirrorRule(0, 2, 0, None)]).validate(unit.holding_block, unit.input_block)
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+import retry_policy
+from retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry_policy.time, 'monotonic', clock)
+    return clock
+
+
+def failing(exception):
+    def fn():
+        raise exception
+    return fn
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_allows_single_probe_after_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+    clock.now += 30.0
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30.0)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_stale_probe_expires(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+    clock.now += 30.0
+    assert breaker.allow()
+    clock.now += 29.0
+    assert not breaker.allow()
+    clock.now += 1.0
+    assert breaker.allow()
+
+
+def test_retry_until_success(monkeypatch):
+    monkeypatch.setattr(retry_policy.time, 'sleep', lambda delay: None)
+    results = iter([OSError(), OSError(), 'ok'])
+
+    def fn():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert RetryPolicy(attempts=3, retry_on=(OSError,)).call(fn) == 'ok'
+
+
+def test_non_retryable_exception_is_raised_immediately():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise KeyError('value')
+
+    with pytest.raises(KeyError):
+        RetryPolicy(attempts=3, retry_on=(OSError,)).call(fn)
+    assert len(calls) == 1
+
+
+def test_open_breaker_rejects_call(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        RetryPolicy().call(lambda: 'ok', breaker=breaker)
+
+
+def test_probe_with_other_exception_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+    clock.now += 30.0
+    with pytest.raises(KeyError):
+        RetryPolicy(attempts=1, retry_on=(OSError,)).call(failing(KeyError('value')), breaker=breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 30.0
+    assert breaker.allow()
+
+
+def test_cancelled_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+    clock.now += 30.0
+
+    async def main():
+        task = asyncio.ensure_future(RetryPolicy(retry_on=(OSError,)).call_async(asyncio.sleep, 10, breaker=breaker))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_call_async_records_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+
+    async def fn():
+        raise OSError()
+
+    with pytest.raises(OSError):
+        asyncio.run(RetryPolicy(attempts=2, base_delay=0.0, retry_on=(OSError,)).call_async(fn, breaker=breaker))
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+import server_logging
+from server_logging import LogSampler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(server_logging.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('test_server_logging')
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def sample(sampler, key, msg, *args):
+    if sampler.enabled(key):
+        sampler.log(key, msg, *args)
+
+
+def test_one_message_per_interval_and_key(clock, logger, caplog):
+    sampler = LogSampler(logger, interval=1.0)
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        for _ in range(3):
+            sample(sampler, 'a', 'Lesevorgang %s', 1)
+        sample(sampler, 'b', 'Lesevorgang %s', 2)
+        clock.now += 1.0
+        sample(sampler, 'a', 'Lesevorgang %s', 3)
+    assert [record.getMessage() for record in caplog.records] == [
+        'Lesevorgang 1', 'Lesevorgang 2', 'Lesevorgang 3 (2 weitere unterdrückt)']
+
+
+def test_disabled_level_skips_formatting(clock, logger):
+    sampler = LogSampler(logger, level=logging.DEBUG)
+    assert not sampler.enabled('a')
+    # Abgeschaltetes Level zählt nicht als unterdrückte Meldung
+    assert sampler.suppressed == {}
+
+
+def test_records_point_at_the_caller(clock, logger, caplog):
+    sampler = LogSampler(logger)
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        sample(sampler, 'a', 'Meldung')
+    assert caplog.records[0].funcName == 'sample'
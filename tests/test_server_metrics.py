@@ -0,0 +1,112 @@
+import asyncio
+import socket
+
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.server import ModbusTcpServer
+
+from register_datastore import build_server_context
+from server_config import SERVER_UNITS
+from server_metrics import Histogram, ServerMetrics, serve_metrics
+
+HOST = '127.0.0.1'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+async def run_with_server(metrics, test):
+    context, _ = build_server_context(SERVER_UNITS)
+    port = free_port()
+    server = ModbusTcpServer(context, address=(HOST, port), request_tracer=metrics.trace_request,
+                             response_manipulator=metrics.trace_response)
+    metrics.connections = server.active_connections
+    await server.listen()
+    try:
+        return await test(port)
+    finally:
+        await server.shutdown()
+
+
+def test_latency_per_request_with_overlapping_transaction_ids():
+    metrics = ServerMetrics()
+
+    async def test(port):
+        clients = [AsyncModbusTcpClient(HOST, port=port) for _ in range(2)]
+        for client in clients:
+            await client.connect()
+        try:
+            # Beide Verbindungen zählen ihre Transaction IDs ab 1, die Anfragen überlappen sich
+            for _ in range(20):
+                responses = await asyncio.gather(*(client.read_input_registers(0, 2, slave=5) for client in clients))
+                assert not any(response.isError() for response in responses)
+            return len(metrics.connections)
+        finally:
+            for client in clients:
+                client.close()
+
+    assert asyncio.run(run_with_server(metrics, test)) == 2
+    assert metrics.requests == {(4, 5): 40}
+    assert metrics.latency[(4, 5)].count == 40
+    assert metrics.errors == {}
+
+
+def test_error_responses_are_counted():
+    metrics = ServerMetrics()
+
+    async def test(port):
+        client = AsyncModbusTcpClient(HOST, port=port)
+        await client.connect()
+        try:
+            return await client.read_holding_registers(5000, 2, slave=5)
+        finally:
+            client.close()
+
+    assert asyncio.run(run_with_server(metrics, test)).isError()
+    assert metrics.errors == {(3, 5): 1}
+    assert metrics.latency[(3, 5)].count == 1
+
+
+def test_diagnostics_and_render():
+    metrics = ServerMetrics()
+    metrics.reject('input_register')
+    metrics.latency[(3, 5)] = histogram = Histogram(metrics.buckets)
+    histogram.observe(0.002)
+    histogram.observe(2.0)
+    metrics.requests[(3, 5)] = 2
+    diagnostics = metrics.diagnostics()
+    assert diagnostics['diag_requests'] == 2
+    assert diagnostics['diag_rejected_writes'] == 1
+    assert diagnostics['diag_latency_mean_us'] == 1001000
+    text = metrics.render()
+    assert 'modbus_request_duration_seconds_bucket{function_code="3",unit="5",le="0.0025"} 1' in text
+    assert 'modbus_request_duration_seconds_bucket{function_code="3",unit="5",le="+Inf"} 2' in text
+    assert 'modbus_rejected_writes_total{reason="input_register"} 1' in text
+
+
+def test_serve_metrics():
+    metrics = ServerMetrics()
+    metrics.requests[(4, 5)] = 3
+    port = free_port()
+
+    async def fetch():
+        task = asyncio.ensure_future(serve_metrics(metrics, HOST, port))
+        try:
+            for _ in range(50):
+                try:
+                    reader, writer = await asyncio.open_connection(HOST, port)
+                    break
+                except OSError:
+                    await asyncio.sleep(0.01)
+            writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+        finally:
+            task.cancel()
+
+    response = asyncio.run(fetch())
+    assert response.startswith('HTTP/1.1 200 OK\r\n')
+    assert 'modbus_requests_total{function_code="4",unit="5"} 3' in response
@@ -0,0 +1,65 @@
+import asyncio
+
+import setpoint_dispatcher
+from setpoint_dispatcher import SetpointDispatcher
+
+
+class Writer:
+    def __init__(self, result=True):
+        self.result = result
+        self.written = []
+
+    def __call__(self, setpoint):
+        self.written.append(setpoint)
+        return self.result
+
+
+def test_write_inside_deadband_is_skipped():
+    dispatcher = SetpointDispatcher(0.01)
+    write = Writer()
+    assert dispatcher.dispatch('refu1', 0.5, write)
+    assert not dispatcher.dispatch('refu1', 0.505, write)
+    assert dispatcher.dispatch('refu1', 0.52, write)
+    assert write.written == [0.5, 0.52]
+
+
+def test_unconfirmed_write_is_retried():
+    dispatcher = SetpointDispatcher(0.01)
+    for result in (None, False, 'OK', 1):
+        assert not dispatcher.dispatch('refu1', 0.5, Writer(result))
+        assert dispatcher.needs_write('refu1', 0.5)
+
+
+def test_max_age_forces_rewrite(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(setpoint_dispatcher.time, 'monotonic', lambda: now[0])
+    dispatcher = SetpointDispatcher(0.01, max_age=300.0)
+    dispatcher.dispatch('refu1', 0.5, Writer())
+    now[0] += 299.0
+    assert not dispatcher.needs_write('refu1', 0.5)
+    now[0] += 1.0
+    assert dispatcher.needs_write('refu1', 0.5)
+
+
+def test_devices_are_independent():
+    dispatcher = SetpointDispatcher(0.01)
+    dispatcher.dispatch('refu1', 0.5, Writer())
+    assert dispatcher.needs_write('refu2', 0.5)
+    dispatcher.invalidate('refu1')
+    assert dispatcher.needs_write('refu1', 0.5)
+
+
+def test_dispatch_async():
+    dispatcher = SetpointDispatcher(0.01)
+    written = []
+
+    async def write(setpoint):
+        written.append(setpoint)
+        return True
+
+    async def main():
+        return [await dispatcher.dispatch_async('meter2', 0.3, write),
+                await dispatcher.dispatch_async('meter2', 0.3, write)]
+
+    assert asyncio.run(main()) == [True, False]
+    assert written == [0.3]